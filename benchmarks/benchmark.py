@@ -0,0 +1,341 @@
+### benchmark.py (Single File Code)
+# Offline benchmark for the challenge 1a outline extractor and the challenge 1b
+# document intelligence pipeline, run against locally generated synthetic PDFs.
+#
+#   python benchmarks/benchmark.py --documents 5 --pages 40 --output bench.json
+
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import datetime
+import contextlib
+import tempfile
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTLINE_MAIN = os.path.join(REPO_ROOT, "challenge 1a", "main.py")
+INTELLIGENCE_MAIN = os.path.join(REPO_ROOT, "challenge 1b", "src", "main.py")
+
+OUTLINE_STAGES = ("parse", "font_analysis", "heading_scan")
+INTELLIGENCE_STAGES = ("parse", "chunking", "embedding", "scoring")
+
+# --- Synthetic PDF Generator ---
+VOCABULARY = (
+    "model data analysis graph neural network molecular property prediction drug discovery "
+    "dataset benchmark performance method results training validation accuracy feature protein "
+    "binding affinity statistical significance revenue growth market segment report annual "
+    "quarter operating income strategy risk sustainability governance research evaluation"
+).split()
+
+# (PyMuPDF base-14 font name, size) pairs used for body text; all stay below the 12pt body bound
+BODY_STYLES = [("helv", 10), ("tiro", 10), ("cour", 9), ("helv", 11), ("tiro", 9), ("hebo", 10)]
+HEADING_STYLES = {1: ("hebo", 20), 2: ("helv", 16), 3: ("hebo", 14)}
+# The title shares the H1 size in another font: a larger title size would become the
+# extractor's H1 level and push the real headings down a level (and H3 out)
+TITLE_STYLE = ("helv", 20)
+
+PAGE_MARGIN = 72
+HEADING_GAP = 24 # Space above a heading, in points; the 1a extractor needs more than 18 (body_text_max_size * heading_gap_factor)
+
+
+def generate_pdf(path, pages, heading_density=1.5, font_variety=2, lines_per_page=40, words_per_line=12,
+                 seed=0, bookmarks=False):
+    """
+    Writes a synthetic PDF and returns a description of it.
+
+    heading_density is the mean number of H1-H3 headings per page, font_variety the
+    number of distinct body text styles (1-6), and lines_per_page / words_per_line
+    control the text volume. With bookmarks=True the headings are also written to the
+    document's outline, which exercises the bookmarks tier of the 1a extractor.
+    """
+    rng = random.Random(seed)
+    body_styles = BODY_STYLES[:max(1, min(font_variety, len(BODY_STYLES)))]
+    doc = fitz.open()
+    toc = []
+    headings = 0
+
+    for page_num in range(pages):
+        page = doc.new_page()
+        bottom = page.rect.height - PAGE_MARGIN
+        y = PAGE_MARGIN
+
+        if page_num == 0:
+            font, size = TITLE_STYLE
+            page.insert_text((PAGE_MARGIN, y), f"Synthetic Benchmark Report {seed}", fontname=font, fontsize=size)
+            y += size * 2
+
+        # Mean heading_density headings per page, spread over the page's line slots
+        heading_count = int(heading_density) + (1 if rng.random() < heading_density % 1 else 0)
+        heading_slots = set(rng.sample(range(lines_per_page), min(heading_count, lines_per_page)))
+        body_font, body_size = rng.choice(body_styles)
+
+        for slot in range(lines_per_page):
+            if slot in heading_slots:
+                level = min(rng.choice((1, 2, 3)), toc[-1][0] + 1 if toc else 1) # Keep the hierarchy well-formed
+                font, size = HEADING_STYLES[level]
+                y += HEADING_GAP + size # Vertical gap above the heading, then its baseline
+                if y > bottom:
+                    break
+                text = f"{rng.choice(VOCABULARY).title()} {rng.choice(VOCABULARY).title()} {page_num + 1}.{slot}"
+                page.insert_text((PAGE_MARGIN, y), text, fontname=font, fontsize=size)
+                toc.append([level, text, page_num + 1])
+                headings += 1
+                y += size * 0.6
+                body_font, body_size = rng.choice(body_styles) # New paragraph, possibly a new style
+                continue
+
+            y += body_size * 1.3
+            if y > bottom:
+                break
+            line = " ".join(rng.choice(VOCABULARY) for _ in range(words_per_line))
+            page.insert_text((PAGE_MARGIN, y), line, fontname=body_font, fontsize=body_size)
+
+    if bookmarks and toc:
+        doc.set_toc(toc)
+    doc.save(path)
+    doc.close()
+    return {"path": path, "pages": pages, "headings": headings}
+
+
+# --- Measurement Helpers ---
+def percentile(values, pct):
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_kb():
+    import resource # POSIX only
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak # macOS reports bytes, Linux KB
+
+
+def _load_module(name, path):
+    module_dir = os.path.dirname(os.path.abspath(path))
+    if module_dir not in sys.path:
+        sys.path.insert(0, module_dir) # Sibling imports (e.g. 1b's embedding_store), as when run as a script
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module # So that pickling module-level functions (process pools) works
+    spec.loader.exec_module(module)
+    return module
+
+
+def summarize(per_document, stage_names, counters):
+    """Aggregates per-document timings into stage totals, latency percentiles and throughput."""
+    latencies = [d["seconds"] for d in per_document]
+    total_seconds = sum(latencies)
+    summary = {
+        "documents": len(per_document),
+        "total_seconds": round(total_seconds, 6),
+        "latency_seconds": {
+            "p50": round(percentile(latencies, 50), 6),
+            "p95": round(percentile(latencies, 95), 6),
+            "mean": round(total_seconds / len(latencies), 6) if latencies else 0.0,
+        },
+        "stages": {},
+    }
+    for stage in stage_names:
+        stage_times = [d["stages"][stage] for d in per_document]
+        summary["stages"][stage] = {
+            "total_seconds": round(sum(stage_times), 6),
+            "p50_seconds": round(percentile(stage_times, 50), 6),
+            "p95_seconds": round(percentile(stage_times, 95), 6),
+        }
+    for counter in counters:
+        count = sum(d[counter] for d in per_document)
+        summary[counter] = count
+        summary[f"{counter}_per_second"] = round(count / total_seconds, 3) if total_seconds > 0 else 0.0
+    return summary
+
+
+# --- Pipeline Benchmarks ---
+def bench_outline(pdf_paths, generated_headings):
+    """
+    Times the 1a heuristic path stage by stage: span table parse, font analysis, heading scan.
+    Also reports the detected headings against generated_headings (one count per PDF), so
+    that documents whose headings the extractor cannot see are noticed.
+    """
+    outline_main = _load_module("outline_main", OUTLINE_MAIN)
+    logging.disable(logging.INFO) # The extractor logs every detected heading
+    extractor = outline_main.PDFOutlineExtractor()
+
+    per_document = []
+    for path, generated in zip(pdf_paths, generated_headings):
+        stages = {}
+        start = time.perf_counter()
+        doc = fitz.open(path)
+        try:
+            span_table = extractor._build_span_table(doc)
+        finally:
+            doc.close()
+        stages["parse"] = time.perf_counter() - start
+
+        mark = time.perf_counter()
+        extractor._analyze_fonts_and_set_heuristics(span_table)
+        stages["font_analysis"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        result = extractor._finalize_outline(*extractor._scan_headings(span_table))
+        stages["heading_scan"] = time.perf_counter() - mark
+
+        per_document.append({
+            "document": os.path.basename(path),
+            "pages": span_table.page_count,
+            "spans": len(span_table),
+            "headings": len(result["outline"]),
+            "generated_headings": generated,
+            "stages": stages,
+            "seconds": time.perf_counter() - start,
+        })
+
+    summary = summarize(per_document, OUTLINE_STAGES, ("pages", "spans"))
+    summary["headings"] = sum(d["headings"] for d in per_document)
+    summary["generated_headings"] = sum(d["generated_headings"] for d in per_document)
+    summary["heading_detection_rate"] = (round(summary["headings"] / summary["generated_headings"], 4)
+                                         if summary["generated_headings"] else 0.0)
+    summary["peak_rss_kb"] = peak_rss_kb()
+    summary["per_document"] = per_document
+    return summary
+
+
+def bench_intelligence(pdf_paths, work_dir):
+    """
+    Times the 1b pipeline stage by stage, on the same path as load_corpus and a run:
+    parse (challenge 1a's document model, or page text without the extractor), chunking,
+    embedding (through the embedding cache) and scoring (rank_corpus, which also drops
+    near-duplicate winners).
+    """
+    os.chdir(work_dir) # 1b resolves ./pdfs, ./output and its caches relative to the working directory
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr): # Keep 1b's progress prints out of the JSON report
+        intelligence_main = _load_module("intelligence_main", INTELLIGENCE_MAIN)
+        intelligence_main.get_model() # Loaded lazily; timed together with the import
+        extractor = intelligence_main.get_outline_extractor()
+    model_load_seconds = time.perf_counter() - start
+
+    persona = next(iter(intelligence_main.personas_data.values()))
+    persona_embedding = intelligence_main.encode_queries([persona["job_to_be_done"]])
+
+    per_document = []
+    for path in pdf_paths:
+        filename = os.path.basename(path)
+        stages = {}
+        start = time.perf_counter()
+        if extractor is not None:
+            document = extractor.parse_document(path)
+        else:
+            pages = intelligence_main.strip_repeated_lines(intelligence_main.iter_pdf_pages(path))
+        stages["parse"] = time.perf_counter() - start
+
+        mark = time.perf_counter()
+        if extractor is not None:
+            chunks = list(intelligence_main.chunk_document(document, filename))
+        else:
+            chunks = list(intelligence_main.chunk_pages(pages, filename))
+        stages["chunking"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        embeddings, encoded = intelligence_main._encode_length_sorted([c["text_chunk"] for c in chunks])
+        stages["embedding"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        [(sections, _)] = intelligence_main.rank_corpus(persona_embedding, chunks, embeddings)
+        stages["scoring"] = time.perf_counter() - mark
+
+        with fitz.open(path) as doc:
+            page_count = doc.page_count
+        per_document.append({
+            "document": filename,
+            "pages": page_count,
+            "chunks": len(chunks),
+            "encoded_chunks": encoded,
+            "relevant_sections": len(sections),
+            "stages": stages,
+            "seconds": sum(stages.values()),
+        })
+
+    summary = summarize(per_document, INTELLIGENCE_STAGES, ("pages", "chunks", "encoded_chunks"))
+    summary["chunker"] = intelligence_main.chunker_id()
+    summary["model_load_seconds"] = round(model_load_seconds, 6)
+    summary["peak_rss_kb"] = peak_rss_kb()
+    summary["per_document"] = per_document
+    return summary
+
+
+def run_isolated(func, *args):
+    """Runs one pipeline benchmark in a fresh process so that its peak RSS is its own."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(func, *args).result()
+
+
+# --- Main Execution Logic ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark both PDF pipelines on synthetic documents.")
+    parser.add_argument("--documents", type=int, default=5, help="Number of synthetic PDFs to generate.")
+    parser.add_argument("--pages", type=int, default=40, help="Pages per synthetic PDF.")
+    parser.add_argument("--heading-density", type=float, default=1.5, help="Mean headings per page.")
+    parser.add_argument("--font-variety", type=int, default=2, help="Distinct body text styles (1-6).")
+    parser.add_argument("--lines-per-page", type=int, default=40, help="Text lines per page.")
+    parser.add_argument("--words-per-line", type=int, default=12, help="Words per text line.")
+    parser.add_argument("--bookmarks", action="store_true", help="Embed the headings as PDF bookmarks.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic content.")
+    parser.add_argument("--pipelines", default="1a,1b", help="Comma-separated pipelines to run (1a, 1b).")
+    parser.add_argument("--pdf-dir", default=None, help="Keep the generated PDFs here (default: a temp dir).")
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    pipelines = [p.strip() for p in args.pipelines.split(",") if p.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_dir = args.pdf_dir or os.path.join(tmp_dir, "pdfs")
+        os.makedirs(pdf_dir, exist_ok=True)
+        documents = [
+            generate_pdf(os.path.join(pdf_dir, f"synthetic_{i:03d}.pdf"), args.pages, args.heading_density,
+                         args.font_variety, args.lines_per_page, args.words_per_line, args.seed + i, args.bookmarks)
+            for i in range(args.documents)
+        ]
+        pdf_paths = [d["path"] for d in documents]
+
+        report = {
+            "generated_at": datetime.datetime.now().isoformat(timespec='seconds'),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "pdf_dir")},
+            "documents": [{"document": os.path.basename(d["path"]), "pages": d["pages"], "headings": d["headings"]}
+                          for d in documents],
+            "pipelines": {},
+        }
+        for pipeline in pipelines:
+            try:
+                if pipeline == "1a":
+                    report["pipelines"]["1a"] = run_isolated(bench_outline, pdf_paths, [d["headings"] for d in documents])
+                elif pipeline == "1b":
+                    report["pipelines"]["1b"] = run_isolated(bench_intelligence, pdf_paths, tmp_dir)
+                else:
+                    report["pipelines"][pipeline] = {"error": f"Unknown pipeline '{pipeline}'"}
+            except Exception as e: # e.g. missing optional dependencies or model files for 1b
+                report["pipelines"][pipeline] = {"error": f"{type(e).__name__}: {e}"}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
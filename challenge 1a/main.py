@@ -5,64 +5,339 @@
 
 import os
 import json
+import time
+import shutil
+import hashlib
 import logging
+import argparse
+from array import array
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 import fitz  # PyMuPDF
 
 # --- Configuration and Logging ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Run as a script (or in its spawned workers), logs go to stderr; imported as a library, the
+# importing program decides how the "outline_extractor" logger is handled.
+if __name__ in ("__main__", "__mp_main__"):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("outline_extractor")
 
 # Define input and output directories relative to where the script is run
 INPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input")
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
+SUMMARY_FILENAME = "batch_summary.json" # Throughput summary written to the output directory
+STORE_SHRINK_INTERVAL = 50 # Pages between MuPDF cache flushes in streaming mode
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".outline_cache")
+CACHE_MAX_MB = 512 # Size bound of the result cache; least recently used entries are evicted first
+FILE_TIMEOUT_SECONDS = 300 # A PDF still unfinished after this long is reported as failed (0 disables the limit)
+
+# Bump whenever a change to the extraction logic alters its output, to invalidate cached results
+EXTRACTOR_VERSION = 1
+# PDFOutlineExtractor attributes that influence the extracted outline (see config_fingerprint)
+OUTPUT_SETTINGS = (
+    "body_text_max_size", "min_heading_size", "level_size_ratio", "heading_gap_factor",
+    "use_embedded_outline", "min_bookmarks",
+)
+
+# --- Compact Span Table ---
+def _is_bold_font(font_name):
+    # Basic check for bold in font name, common for bold fonts
+    lowered = font_name.lower()
+    return "bold" in lowered or "bolder" in lowered or "heavy" in lowered
+
+
+class SpanTable:
+    """
+    Column-oriented store of every text span in a document.
+
+    Each page is parsed once with page.get_text("dict") and its spans are appended
+    as rows of flat arrays instead of being kept as nested dicts. Font names are
+    interned (one entry per distinct font) and span texts are concatenated into a
+    single string addressed by offsets. Both the style histogram and the heading
+    scan run over this table.
+    """
+
+    def __init__(self):
+        self.fonts = []                 # font id -> font name
+        self.font_is_bold = array('B')  # font id -> bold flag
+        self._font_ids = {}             # font name -> font id
+
+        self.font_id = array('I')       # per span: font id
+        self.size = array('d')          # per span: font size rounded to 0.1
+        self.page = array('I')          # per span: 0-based page number
+        self.line = array('I')          # per span: document-wide line id
+        self.is_first = array('B')      # per span: first span of the first block of its page
+        self.x0 = array('d')
+        self.y0 = array('d')
+        self.x1 = array('d')
+        self.y1 = array('d')
+        self.text_offsets = array('Q', [0])  # span i text is text[text_offsets[i]:text_offsets[i + 1]]
+        self.text = ""
+
+        self.page_count = 0
+        self._text_parts = []
+        self._text_length = 0
+        self._line_count = 0
+
+    def __len__(self):
+        return len(self.font_id)
+
+    def _intern_font(self, font_name):
+        font_id = self._font_ids.get(font_name)
+        if font_id is None:
+            font_id = len(self.fonts)
+            self._font_ids[font_name] = font_id
+            self.fonts.append(font_name)
+            self.font_is_bold.append(1 if _is_bold_font(font_name) else 0)
+        return font_id
+
+    def add_page(self, page_num, blocks):
+        """Appends the spans of one page, given the blocks of its text dict."""
+        for b_idx, b in enumerate(blocks):
+            if b['type'] != 0: # not a text block
+                continue
+            for l_idx, line in enumerate(b['lines']):
+                line_id = self._line_count
+                self._line_count += 1
+                for s_idx, span in enumerate(line['spans']):
+                    text = span['text']
+                    bbox = span['bbox']
+                    self.font_id.append(self._intern_font(span['font']))
+                    self.size.append(round(span['size'], 1))
+                    self.page.append(page_num)
+                    self.line.append(line_id)
+                    self.is_first.append(1 if b_idx == 0 and l_idx == 0 and s_idx == 0 else 0)
+                    self.x0.append(bbox[0])
+                    self.y0.append(bbox[1])
+                    self.x1.append(bbox[2])
+                    self.y1.append(bbox[3])
+                    self._text_parts.append(text)
+                    self._text_length += len(text)
+                    self.text_offsets.append(self._text_length)
+        self.page_count = max(self.page_count, page_num + 1)
+
+    def _append_rows(self, other, indices, line_offset=0):
+        for i in indices:
+            text = other.span_text(i)
+            self.font_id.append(self._intern_font(other.fonts[other.font_id[i]]))
+            self.size.append(other.size[i])
+            self.page.append(other.page[i])
+            self.line.append(other.line[i] + line_offset)
+            self.is_first.append(other.is_first[i])
+            self.x0.append(other.x0[i])
+            self.y0.append(other.y0[i])
+            self.x1.append(other.x1[i])
+            self.y1.append(other.y1[i])
+            self._text_parts.append(text)
+            self._text_length += len(text)
+            self.text_offsets.append(self._text_length)
+
+    def subset(self, indices):
+        """Returns a new table holding only the given rows (line ids are preserved)."""
+        table = SpanTable()
+        table._append_rows(self, indices)
+        table._line_count = self._line_count
+        table.page_count = self.page_count
+        return table.finalize()
+
+    def extend(self, other):
+        """Appends all rows of another table, keeping line ids unique."""
+        self._append_rows(other, range(len(other)), line_offset=self._line_count)
+        self._line_count += other._line_count
+        self.page_count = max(self.page_count, other.page_count)
+        return self
+
+    def finalize(self):
+        """Joins the buffered span texts; call once after the last page is added."""
+        if self._text_parts:
+            self.text += "".join(self._text_parts)
+            self._text_parts = []
+        return self
+
+    def span_text(self, i):
+        return self.text[self.text_offsets[i]:self.text_offsets[i + 1]]
+
+    def span_text_length(self, i):
+        return self.text_offsets[i + 1] - self.text_offsets[i]
+
+
+# --- Shared Document Model ---
+class DocumentModel:
+    """
+    Everything a single parse of a PDF yields: its span table (every span with its page
+    and line), its title and outline, and the tier that produced them. The outline is the
+    one extract_outline returns; challenge 1b builds the same model to chunk documents by
+    outline section, so both pipelines share one parser and one parse per document.
+    """
+
+    def __init__(self, span_table, title, outline, tier):
+        self.spans = span_table
+        self.title = title
+        self.outline = outline
+        self.tier = tier
+        self._lines = None
+
+    @property
+    def page_count(self):
+        return self.spans.page_count
+
+    def outline_result(self):
+        """The {"title", "outline"} result of extract_outline."""
+        return {"title": self.title, "outline": self.outline}
+
+    def lines(self):
+        """(1-based page number, text) of every line in reading order, spans joined as extracted."""
+        if self._lines is None:
+            self._lines = []
+            current_line = None
+            for i in range(len(self.spans)):
+                if self.spans.line[i] != current_line:
+                    current_line = self.spans.line[i]
+                    self._lines.append((self.spans.page[i] + 1, []))
+                self._lines[-1][1].append(self.spans.span_text(i))
+            self._lines = [(page, "".join(parts)) for page, parts in self._lines]
+        return self._lines
+
+    # A line with which the heading text starts (a heading wrapped over several lines) must
+    # hold at least this fraction of it, so that e.g. a page number or the "1" of
+    # "1. Introduction" cannot be taken for the heading
+    WRAPPED_HEADING_MIN_FRACTION = 0.5
+
+    def _heading_line(self, item, start):
+        """
+        Index of the line, at or after start, where an outline entry begins: the first line
+        on its page that starts with the heading text, or with which the heading text starts
+        while holding at least WRAPPED_HEADING_MIN_FRACTION of it (case and whitespace
+        ignored), else the first line on its page. None if no line matches.
+        """
+        heading = " ".join(item["text"].split()).lower()
+        first_on_page = None
+        for index in range(start, len(self.lines())):
+            page, text = self.lines()[index]
+            if page > item["page"]:
+                break
+            if page < item["page"]:
+                continue
+            text = " ".join(text.split()).lower()
+            if text and (text.startswith(heading) or
+                         (heading.startswith(text) and len(text) >= self.WRAPPED_HEADING_MIN_FRACTION * len(heading))):
+                return index
+            if first_on_page is None:
+                first_on_page = index
+        return first_on_page
+
+    def sections(self):
+        """
+        Splits the lines at the outline entries. Returns one {"title", "level", "lines"}
+        dict per section in reading order, lines being (page, text) pairs; lines before the
+        first heading form a section titled with the document title (level None). Entries
+        that cannot be placed (e.g. bookmarks pointing backwards) stay in the section before.
+        """
+        lines = self.lines()
+        starts = [(0, self.title, None)]
+        for item in self.outline:
+            index = self._heading_line(item, starts[-1][0] + 1 if len(starts) > 1 else 0)
+            if index is not None:
+                starts.append((index, item["text"], item["level"]))
+        if len(starts) > 1 and starts[1][0] == 0:
+            starts.pop(0) # The document opens with a heading
+        bounds = [index for index, _, _ in starts[1:]] + [len(lines)]
+        return [{"title": title, "level": level, "lines": lines[index:end]}
+                for (index, title, level), end in zip(starts, bounds) if end > index]
+
 
 # --- PDF Outline Extractor Class ---
 class PDFOutlineExtractor:
     def __init__(self):
         self.heading_style_rules = [] # Will store (font_name, font_size, is_bold, level) tuples
         self.body_text_max_size = 12.0 # Upper bound for typical body text. Tune this!
+        self.min_heading_size = 8.0 # Styles smaller than this are never headings (likely non-content)
+        self.level_size_ratio = 0.9 # Each heading level must be at least 10% smaller than the one above
+        self.heading_gap_factor = 1.5 # Vertical gap above a heading, in multiples of body_text_max_size
+        self.min_pages_per_shard = 32 # Smallest page range worth handing to a shard worker
+        self.use_embedded_outline = True # Try the PDF's own bookmarks before the font heuristics
+        self.min_bookmarks = 3 # Fewest usable H1-H3 bookmarks for the embedded outline to be trusted
+        self.last_page_count = 0 # Page count of the most recently processed document
+        self.last_tier = None # Which tier produced the most recent result: "bookmarks" or "heuristic"
+
+    def settings(self):
+        """The configuration that determines the extracted outline."""
+        return {name: getattr(self, name) for name in OUTPUT_SETTINGS}
+
+    def config_fingerprint(self):
+        """Stable hash of EXTRACTOR_VERSION and settings(), used to key cached results."""
+        payload = json.dumps({"version": EXTRACTOR_VERSION, "settings": self.settings()}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-    def _analyze_fonts_and_set_heuristics(self, doc):
+    def _build_span_table(self, doc, start_page=0, end_page=None):
         """
-        Analyzes font sizes and styles across the document to infer potential heading levels.
-        This is a heuristic-based approach. For robust results across diverse PDFs,
-        this method often requires significant tuning or more advanced techniques
-        (e.g., text clustering, machine learning).
+        Parses every page of the document (or of [start_page, end_page)) exactly once
+        into a SpanTable. Pages whose text cannot be extracted are logged and skipped.
         """
-        unique_text_styles = {} # (font_name, font_size, is_bold) -> total_text_length
-
-        for page_num in range(doc.page_count):
-            page = doc.load_page(page_num)
+        span_table = SpanTable()
+        end_page = doc.page_count if end_page is None else end_page
+        for page_num in range(start_page, end_page):
             try:
+                page = doc.load_page(page_num)
                 blocks = page.get_text("dict")["blocks"]
-                for b in blocks:
-                    if b['type'] == 0: # text block
-                        for line in b['lines']:
-                            for span in line['spans']:
-                                font_name = span['font']
-                                font_size = round(span['size'], 1)
-                                # Basic check for bold in font name, common for bold fonts
-                                is_bold = "bold" in font_name.lower() or "bolder" in font_name.lower() or "heavy" in font_name.lower()
-
-                                style_key = (font_name, font_size, is_bold)
-                                unique_text_styles[style_key] = unique_text_styles.get(style_key, 0) + len(span['text']) # Sum of text length
-
             except Exception as e:
-                logging.warning(f"Could not extract text dict from page {page_num + 1}: {e}")
+                logger.warning(f"Could not extract text dict from page {page_num + 1}: {e}")
                 continue
+            span_table.add_page(page_num, blocks)
+            del page, blocks # Release the page's dicts before parsing the next one
+        span_table.page_count = doc.page_count
+        return span_table.finalize()
+
+    def _style_histogram(self, span_table):
+        """Returns (font_name, font_size, is_bold) -> total_text_length over the table."""
+        counts = {} # (font_id, font_size) -> total_text_length
+        font_id, size, offsets = span_table.font_id, span_table.size, span_table.text_offsets
+        for i in range(len(span_table)):
+            key = (font_id[i], size[i])
+            counts[key] = counts.get(key, 0) + offsets[i + 1] - offsets[i] # Sum of text length
+
+        unique_text_styles = {}
+        for (fid, font_size), total_len in counts.items():
+            font_name = span_table.fonts[fid]
+            unique_text_styles[(font_name, font_size, bool(span_table.font_is_bold[fid]))] = total_len
+        return unique_text_styles
+
+    @staticmethod
+    def _merge_histograms(histograms):
+        """Sums partial style histograms, keeping first-appearance order across shards."""
+        merged = {}
+        for histogram in histograms:
+            for style_key, total_len in histogram.items():
+                merged[style_key] = merged.get(style_key, 0) + total_len
+        return merged
+
+    def _analyze_fonts_and_set_heuristics(self, span_table):
+        """
+        Analyzes font sizes and styles across the document to infer potential heading levels.
+        This is a heuristic-based approach. For robust results across diverse PDFs,
+        this method often requires significant tuning or more advanced techniques
+        (e.g., text clustering, machine learning).
+        """
+        self._set_heading_rules(self._style_histogram(span_table))
 
+    def _set_heading_rules(self, unique_text_styles):
+        """Derives heading_style_rules from a (font_name, font_size, is_bold) -> text length histogram."""
         # Sort styles by size and then by total text length (prominence)
         sorted_styles = sorted(unique_text_styles.items(),
                                key=lambda item: (item[0][1], item[1]), # Sort by font size, then by text length
                                reverse=True)
 
-        logging.info(f"Analyzed unique text styles: {sorted_styles}")
+        logger.info(f"Analyzed unique text styles: {sorted_styles}")
 
         heading_candidates = []
         seen_sizes = set()
 
         # Find distinct font sizes that are candidates for headings
         for (font_name, font_size, is_bold), total_len in sorted_styles:
-            if font_size < 8.0: # Filter out very small text (likely non-content)
+            if font_size < self.min_heading_size: # Filter out very small text (likely non-content)
                 continue
             if font_size not in seen_sizes:
                 heading_candidates.append((font_name, font_size, is_bold, total_len))
@@ -85,154 +360,819 @@ class PDFOutlineExtractor:
                 )
                 if len(content_heading_candidates) > 1:
                     # Second candidate is H2, if significantly smaller than H1
-                    if content_heading_candidates[1][1] < content_heading_candidates[0][1] * 0.9: # 10% smaller to be distinct
+                    if content_heading_candidates[1][1] < content_heading_candidates[0][1] * self.level_size_ratio: # 10% smaller to be distinct
                         self.heading_style_rules.append(
                             (content_heading_candidates[1][0], content_heading_candidates[1][1], content_heading_candidates[1][2], "H2")
                         )
                     if len(content_heading_candidates) > 2:
                         # Third candidate is H3, if significantly smaller than H2
-                        if content_heading_candidates[2][1] < content_heading_candidates[1][1] * 0.9:
+                        if content_heading_candidates[2][1] < content_heading_candidates[1][1] * self.level_size_ratio:
                             self.heading_style_rules.append(
                                 (content_heading_candidates[2][0], content_heading_candidates[2][1], content_heading_candidates[2][2], "H3")
                             )
 
-        logging.info(f"Inferred heading style rules: {self.heading_style_rules}")
-
-
-    def extract_outline(self, pdf_path):
-        doc = fitz.open(pdf_path)
-        
-        self._analyze_fonts_and_set_heuristics(doc)
+        logger.info(f"Inferred heading style rules: {self.heading_style_rules}")
 
+    def _scan_headings(self, span_table):
+        """
+        Walks the span table in reading order and applies the inferred heading rules.
+        Returns (title, outline) before any title promotion.
+        """
+        title = ""
         outline = []
+        for kind, value in self._iter_scan(span_table):
+            if kind == "title":
+                title = value
+            else:
+                outline.append(value)
+        return title, outline
+
+    def _iter_scan(self, span_table):
+        """
+        Generator behind _scan_headings: yields ("title", text) when the title is
+        detected and ("heading", item) for every outline entry, in reading order.
+        """
+        last_item = None
         title = ""
 
         last_span_end_y = 0 # To track vertical spacing between text elements
         last_page_num = -1
+        skip_line = -1 # Line id whose remaining spans are skipped after a heading was found
+
+        font_id, size, page, line = span_table.font_id, span_table.size, span_table.page, span_table.line
+        y0, y1, is_first = span_table.y0, span_table.y1, span_table.is_first
+        font_is_bold = span_table.font_is_bold
+
+        for i in range(len(span_table)):
+            page_num = page[i]
 
-        for page_num in range(doc.page_count):
-            page = doc.load_page(page_num)
-            
             # Reset Y tracking for a new page
             if page_num != last_page_num:
                 last_span_end_y = 0
                 last_page_num = page_num
 
-            blocks = page.get_text("dict")["blocks"]
-
-            for b_idx, b in enumerate(blocks):
-                if b['type'] == 0: # text block
-                    for l_idx, line in enumerate(b['lines']):
-                        for s_idx, span in enumerate(line['spans']):
-                            text = span['text'].strip()
-                            if not text:
-                                continue
-
-                            font_name = span['font']
-                            font_size = round(span['size'], 1)
-                            is_bold = "bold" in font_name.lower() or "bolder" in font_name.lower() or "heavy" in font_name.lower()
-
-                            span_start_y = span['bbox'][1]
-
-                            # Title detection: Try to find the most prominent text on the first page
-                            if page_num == 0 and not title and font_size > self.body_text_max_size:
-                                # Simple heuristic: first large text block on the first page
-                                # A better heuristic might check if it's visually centered or has unique high prominence.
-                                if b_idx == 0 and l_idx == 0 and s_idx == 0: # Very first text element
-                                     title = text
-                                     logging.info(f"Detected potential title: '{title}' on page {page_num + 1}")
-                                     last_span_end_y = span['bbox'][3]
-                                     continue # Skip further heading detection for the title
-
-                            # Heading detection using inferred rules
-                            current_level = None
-                            for rule_font_name, rule_font_size, rule_is_bold, level_name in self.heading_style_rules:
-                                if (font_size == rule_font_size and
-                                    (not rule_is_bold or is_bold)): # If rule requires bold, span must be bold
-                                    current_level = level_name
-                                    break
-
-                            if current_level:
-                                # Contextual check: Ensure it's a distinct heading, not part of flowing text.
-                                # Check for a significant vertical gap above the text, or if it's the first text on page/block.
-                                vertical_gap = span_start_y - last_span_end_y
-                                
-                                # Threshold for a "significant gap" (e.g., 1.5 times the max body text height)
-                                if vertical_gap > self.body_text_max_size * 1.5 or last_span_end_y == 0:
-                                    
-                                    # Avoid adding duplicate headings (e.g., if extracted multiple times due to slight layout variations)
-                                    is_duplicate = False
-                                    if outline:
-                                        last_item = outline[-1]
-                                        # Same text, same level, and on the same page (or very close lines on same page)
-                                        if (last_item["text"] == text and
-                                            last_item["level"] == current_level and
-                                            last_item["page"] == page_num + 1):
-                                            is_duplicate = True
-
-                                    if not is_duplicate:
-                                        outline.append({
-                                            "level": current_level,
-                                            "text": text,
-                                            "page": page_num + 1
-                                        })
-                                        logging.info(f"Detected {current_level}: '{text}' on page {page_num + 1}")
-                                        
-                                    last_span_end_y = span['bbox'][3] # Update last Y
-                                    break # Move to next line after finding a heading for this line
-
-                            last_span_end_y = span['bbox'][3] # Always update last Y position
-
-        doc.close()
-        
-        # Post-processing: If title is still empty, try to derive from first H1
-        if not title and outline:
-            first_h1_on_page_1 = next((item for item in outline if item["level"] == "H1" and item["page"] == 1), None)
-            if first_h1_on_page_1:
-                title = first_h1_on_page_1["text"]
-                # Remove this H1 from the outline if it's now considered the title
-                outline = [item for item in outline if not (item["level"] == "H1" and item["text"] == title and item["page"] == 1)]
-                logging.info(f"Promoted first H1 on page 1 to title: '{title}'")
-            elif outline: # As a last resort, use the first general heading found
-                title = outline[0]["text"]
-                logging.info(f"Using first detected outline item as title: '{title}'")
-
-
-        return {"title": title, "outline": outline}
+            if line[i] == skip_line:
+                continue
+
+            text = span_table.span_text(i).strip()
+            if not text:
+                continue
 
-# --- Main Execution Logic ---
-def main():
-    if not os.path.exists(INPUT_DIR):
-        logging.error(f"Input directory not found: {INPUT_DIR}. Please create it and place PDFs inside.")
-        return
+            font_size = size[i]
+            is_bold = font_is_bold[font_id[i]]
+
+            span_start_y = y0[i]
+
+            # Title detection: Try to find the most prominent text on the first page
+            if page_num == 0 and not title and font_size > self.body_text_max_size:
+                # Simple heuristic: first large text block on the first page
+                # A better heuristic might check if it's visually centered or has unique high prominence.
+                if is_first[i]: # Very first text element
+                     title = text
+                     logger.info(f"Detected potential title: '{title}' on page {page_num + 1}")
+                     yield "title", title
+                     last_span_end_y = y1[i]
+                     continue # Skip further heading detection for the title
+
+            # Heading detection using inferred rules
+            current_level = None
+            for rule_font_name, rule_font_size, rule_is_bold, level_name in self.heading_style_rules:
+                if (font_size == rule_font_size and
+                    (not rule_is_bold or is_bold)): # If rule requires bold, span must be bold
+                    current_level = level_name
+                    break
+
+            if current_level:
+                # Contextual check: Ensure it's a distinct heading, not part of flowing text.
+                # Check for a significant vertical gap above the text, or if it's the first text on page/block.
+                vertical_gap = span_start_y - last_span_end_y
+
+                # Threshold for a "significant gap" (e.g., 1.5 times the max body text height)
+                if vertical_gap > self.body_text_max_size * self.heading_gap_factor or last_span_end_y == 0:
+
+                    # Avoid adding duplicate headings (e.g., if extracted multiple times due to slight layout variations)
+                    is_duplicate = False
+                    if last_item is not None:
+                        # Same text, same level, and on the same page (or very close lines on same page)
+                        if (last_item["text"] == text and
+                            last_item["level"] == current_level and
+                            last_item["page"] == page_num + 1):
+                            is_duplicate = True
+
+                    if not is_duplicate:
+                        last_item = {
+                            "level": current_level,
+                            "text": text,
+                            "page": page_num + 1
+                        }
+                        yield "heading", last_item
+                        logger.info(f"Detected {current_level}: '{text}' on page {page_num + 1}")
+
+                    last_span_end_y = y1[i] # Update last Y
+                    skip_line = line[i] # Move to next line after finding a heading for this line
+                    continue
+
+            last_span_end_y = y1[i] # Always update last Y position
+
+    def _heading_context_rows(self, span_table):
+        """
+        Returns the rows of span_table that the heading scan can be influenced by.
+
+        Only non-empty spans larger than body_text_max_size can become the title or a
+        heading. Besides those, the scan needs every span on a line that holds such a
+        candidate (they may be skipped once a heading is found) and the non-empty span
+        right before each kept span on the same page (it provides the vertical gap).
+        Scanning just these rows gives exactly the same result as scanning the table.
+        """
+        size, page, line = span_table.size, span_table.page, span_table.line
+        non_empty = [i for i in range(len(span_table)) if span_table.span_text(i).strip()]
+        candidate_lines = {line[i] for i in non_empty if size[i] > self.body_text_max_size}
+
+        keep = set()
+        previous = None
+        for i in non_empty:
+            if line[i] in candidate_lines:
+                keep.add(i)
+                if previous is not None and page[previous] == page[i]:
+                    keep.add(previous)
+            previous = i
+        return sorted(keep)
+
+    def _scan_page_range(self, pdf_path, start_page, end_page):
+        """
+        Shard worker: parses pages [start_page, end_page) of the document once and
+        returns (partial style histogram, span table reduced to heading context rows).
+        """
+        doc = fitz.open(pdf_path)
+        try:
+            span_table = self._build_span_table(doc, start_page, end_page)
+        finally:
+            doc.close()
+        histogram = self._style_histogram(span_table)
+        return histogram, span_table.subset(self._heading_context_rows(span_table))
+
+    def _outline_from_bookmarks(self, doc):
+        """
+        Fast path: builds the outline from the document's embedded bookmarks.
+        Returns None if the bookmark tree is missing or fails the quality checks, in
+        which case the caller falls back to the font heuristics.
+        """
+        toc = doc.get_toc(simple=True) # [[level, title, page], ...]
+        if not toc:
+            return None
+
+        outline = []
+        invalid = 0
+        for level, text, page in toc:
+            text = " ".join(str(text).split())
+            if not text or not 1 <= page <= doc.page_count:
+                invalid += 1 # Empty title or external/broken link target
+                continue
+            if level > 3: # Only H1-H3 are reported
+                continue
+            item = {"level": f"H{level}", "text": text, "page": page}
+            if outline and outline[-1] == item:
+                continue
+            outline.append(item)
 
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
-        logging.info(f"Created output directory: {OUTPUT_DIR}")
+        # Quality checks: enough entries, mostly valid targets, a well-formed hierarchy
+        # that starts at H1 and never skips a level, and pages in reading order.
+        if len(outline) < self.min_bookmarks:
+            return None
+        if invalid > 0.1 * len(toc):
+            return None
+        if outline[0]["level"] != "H1":
+            return None
+        levels = [int(item["level"][1]) for item in outline]
+        if any(current > previous + 1 for previous, current in zip(levels, levels[1:])):
+            return None
+        backwards = sum(1 for a, b in zip(outline, outline[1:]) if b["page"] < a["page"])
+        if backwards > 0.1 * len(outline):
+            return None
 
+        title = self._metadata_title(doc) or self._first_page_title(doc)
+        logger.info(f"Using {len(outline)} embedded bookmarks as the outline")
+        return title, outline
+
+    @staticmethod
+    def _metadata_title(doc):
+        title = " ".join((doc.metadata or {}).get("title", "").split())
+        # Skip placeholders and titles that are just the authoring tool's file name
+        if title.lower() in ("", "untitled", "title") or title.lower().endswith((".doc", ".docx", ".pdf", ".ppt", ".pptx", ".indd")):
+            return ""
+        return title
+
+    def _first_page_title(self, doc):
+        """Runs only the title detection of the heading scan over the first page."""
+        if doc.page_count == 0:
+            return ""
+        self.heading_style_rules = []
+        title, _ = self._scan_headings(self._build_span_table(doc, 0, 1))
+        return title
+
+    def _parse_heading_context(self, doc):
+        """
+        Streaming parse: visits every page once, folding its spans into the style
+        histogram and keeping only its heading context rows (see _heading_context_rows).
+        Each page's full span table is dropped as soon as the page is done, so memory
+        grows with the number of heading candidates rather than with the page count.
+        """
+        histogram = {}
+        context_table = SpanTable()
+        for page_num in range(doc.page_count):
+            page_table = self._build_span_table(doc, page_num, page_num + 1)
+            histogram = self._merge_histograms([histogram, self._style_histogram(page_table)])
+            context_table.extend(page_table.subset(self._heading_context_rows(page_table)))
+            del page_table
+            if (page_num + 1) % STORE_SHRINK_INTERVAL == 0:
+                fitz.TOOLS.store_shrink(100) # Drop MuPDF's cached page resources
+        context_table.page_count = doc.page_count
+        return histogram, context_table.finalize()
+
+    @staticmethod
+    def _promote_title(events):
+        """
+        Applies title promotion to a stream of ("title", text) / ("heading", item) events.
+
+        Yields ("title", title) exactly once, before any heading, then the remaining
+        ("heading", item) events. Page-1 headings are held back only until page 1 is
+        finished, because they are the only ones title promotion can remove.
+        """
+        title = ""
+        title_emitted = False
+        page_one = []
+
+        def settle(next_item):
+            # Post-processing: If title is still empty, try to derive from first H1
+            nonlocal title, page_one
+            if not title:
+                first_h1_on_page_1 = next((item for item in page_one if item["level"] == "H1"), None)
+                if first_h1_on_page_1:
+                    title = first_h1_on_page_1["text"]
+                    # Remove this H1 from the outline if it's now considered the title
+                    page_one = [item for item in page_one if not (item["level"] == "H1" and item["text"] == title)]
+                    logger.info(f"Promoted first H1 on page 1 to title: '{title}'")
+                elif page_one or next_item: # As a last resort, use the first general heading found
+                    title = (page_one[0] if page_one else next_item)["text"]
+                    logger.info(f"Using first detected outline item as title: '{title}'")
+            yield "title", title
+            for item in page_one:
+                yield "heading", item
+            page_one = []
+
+        for kind, value in events:
+            if kind == "title":
+                title = value
+            elif title_emitted:
+                yield kind, value
+            elif value["page"] == 1:
+                page_one.append(value)
+            else:
+                title_emitted = True
+                yield from settle(value)
+                yield kind, value
+
+        if not title_emitted:
+            yield from settle(None)
+
+    def _finalize_outline(self, title, outline):
+        events = [("title", title)] + [("heading", item) for item in outline]
+        result = {"title": "", "outline": []}
+        for kind, value in self._promote_title(events):
+            if kind == "title":
+                result["title"] = value
+            else:
+                result["outline"].append(value)
+        return result
+
+    def iter_outline_records(self, pdf_path):
+        """
+        Streaming variant of extract_outline that yields NDJSON-ready records:
+        {"type": "title", "title": ...} first, then {"type": "heading", "level", "text", "page"}
+        per outline entry. Only one page's spans are alive at any time; the heuristic
+        tier parses the document once and then emits headings page by page.
+        """
+        doc = fitz.open(pdf_path)
+        try:
+            self.last_page_count = doc.page_count
+            bookmarks = self._outline_from_bookmarks(doc) if self.use_embedded_outline else None
+            if bookmarks is None:
+                self.last_tier = "heuristic"
+                histogram, context_table = self._parse_heading_context(doc)
+        finally:
+            doc.close()
+
+        if bookmarks is not None:
+            self.last_tier = "bookmarks"
+            events = [("title", bookmarks[0])] + [("heading", item) for item in bookmarks[1]]
+        else:
+            self._set_heading_rules(histogram)
+            events = self._iter_scan(context_table)
+
+        for kind, value in self._promote_title(events):
+            if kind == "title":
+                yield {"type": "title", "title": value}
+            else:
+                yield {"type": "heading", **value}
+
+    def extract_outline(self, pdf_path, shard_workers=1):
+        """
+        Extracts {"title", "outline"} from a PDF.
+
+        The embedded bookmarks are tried first (tier "bookmarks"); only documents without
+        a usable bookmark tree go through the font heuristics (tier "heuristic"). The tier
+        is recorded in last_tier. With shard_workers > 1, documents of at least
+        2 * min_pages_per_shard pages are split into page ranges that are parsed in
+        parallel; the result is identical to the serial one.
+        """
+        doc = fitz.open(pdf_path)
+        try:
+            page_count = doc.page_count
+            self.last_page_count = page_count
+            bookmarks = self._outline_from_bookmarks(doc) if self.use_embedded_outline else None
+            if bookmarks is not None:
+                self.last_tier = "bookmarks"
+                return self._finalize_outline(*bookmarks)
+
+            self.last_tier = "heuristic"
+            shards = _page_shards(page_count, shard_workers, self.min_pages_per_shard)
+            if len(shards) <= 1:
+                span_table = self._build_span_table(doc)
+        finally:
+            doc.close()
+
+        if len(shards) <= 1:
+            return self._heuristic_outline(span_table)
+        else:
+            logger.info(f"Sharding {page_count} pages of {pdf_path} into {len(shards)} page ranges")
+            histograms = []
+            span_table = SpanTable()
+            with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+                futures = [
+                    pool.submit(_scan_shard, self.settings(), pdf_path, start, end)
+                    for start, end in shards
+                ]
+                for future in futures: # Merge in page order
+                    histogram, context_table = future.result()
+                    histograms.append(histogram)
+                    span_table.extend(context_table)
+            span_table.finalize()
+            self._set_heading_rules(self._merge_histograms(histograms))
+
+        title, outline = self._scan_headings(span_table)
+        return self._finalize_outline(title, outline)
+
+    def _heuristic_outline(self, span_table):
+        """Font heuristics over a whole-document span table: {"title", "outline"}."""
+        self._analyze_fonts_and_set_heuristics(span_table)
+        title, outline = self._scan_headings(span_table)
+        return self._finalize_outline(title, outline)
+
+    def parse_document(self, pdf_path):
+        """
+        Builds the DocumentModel of a PDF in one pass over its pages: the full span table,
+        plus the outline from the embedded bookmarks or, failing those, from the font
+        heuristics run over that same table. The outline equals extract_outline's.
+        """
+        doc = fitz.open(pdf_path)
+        try:
+            self.last_page_count = doc.page_count
+            bookmarks = self._outline_from_bookmarks(doc) if self.use_embedded_outline else None
+            span_table = self._build_span_table(doc)
+        finally:
+            doc.close()
+
+        if bookmarks is not None:
+            self.last_tier = "bookmarks"
+            result = self._finalize_outline(*bookmarks)
+        else:
+            self.last_tier = "heuristic"
+            result = self._heuristic_outline(span_table)
+        return DocumentModel(span_table, result["title"], result["outline"], self.last_tier)
+
+
+def _page_shards(page_count, shard_workers, min_pages_per_shard):
+    """Splits [0, page_count) into at most shard_workers contiguous ranges of >= min_pages_per_shard pages."""
+    shard_count = min(shard_workers, page_count // max(1, min_pages_per_shard))
+    if shard_count <= 1:
+        return [(0, page_count)]
+    bounds = [page_count * k // shard_count for k in range(shard_count + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _scan_shard(settings, pdf_path, start_page, end_page):
     extractor = PDFOutlineExtractor()
+    for name, value in settings.items():
+        setattr(extractor, name, value)
+    return extractor._scan_page_range(pdf_path, start_page, end_page)
+
+
+# --- Result Cache ---
+class ResultCache:
+    """
+    Persistent, content-addressed cache of extracted outlines.
 
-    pdf_found = False
-    for filename in os.listdir(INPUT_DIR):
-        if filename.lower().endswith(".pdf"):
-            pdf_found = True
-            pdf_path = os.path.join(INPUT_DIR, filename)
-            output_filename = os.path.splitext(filename)[0] + ".json"
-            output_path = os.path.join(OUTPUT_DIR, output_filename)
+    Entries are keyed by the SHA-256 of the PDF's bytes plus the extractor's
+    config_fingerprint() and the output format, so a cached result is reused only
+    when neither the file nor any setting that affects the output has changed.
+    To skip unchanged inputs without re-reading them, the content hash of each path
+    is remembered together with its size and mtime. The cache is bounded to
+    max_bytes; the least recently used entries are evicted first.
 
-            logging.info(f"Processing {pdf_path}...")
+    The cache is only touched from the parent process: lookups happen before jobs
+    are dispatched and results are stored after their workers have finished.
+    """
+
+    INDEX_FILENAME = "index.json"
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.files = {}   # absolute path -> [size, mtime_ns, sha256]
+        self.entries = {} # key -> {"size", "last_used", "tier", "pages"}
+        os.makedirs(cache_dir, exist_ok=True)
+        index_path = os.path.join(cache_dir, self.INDEX_FILENAME)
+        if os.path.exists(index_path):
             try:
-                result = extractor.extract_outline(pdf_path)
-                with open(output_path, "w", encoding="utf-8") as f:
-                    json.dump(result, f, ensure_ascii=False, indent=2)
-                logging.info(f"Successfully processed {filename}. Output saved to {output_path}")
-            except Exception as e:
-                logging.error(f"Error processing {filename}: {e}", exc_info=True) # exc_info to print traceback
+                with open(index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                self.files = index.get("files", {})
+                self.entries = index.get("entries", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable cache index {index_path}: {e}")
+
+    def content_hash(self, path):
+        """SHA-256 of the file, re-read only if its size or mtime changed."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.files.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(content_hash, fingerprint, output_format):
+        return hashlib.sha256(f"{content_hash}:{fingerprint}:{output_format}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
 
-    if not pdf_found:
-        logging.warning(f"No PDF files found in the input directory: {INPUT_DIR}")
+    def get(self, key, output_path):
+        """Copies a cached result to output_path; returns its entry, or None on a miss."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        try:
+            shutil.copyfile(self._entry_path(key), output_path)
+        except OSError:
+            del self.entries[key] # Entry file vanished; treat as a miss
+            return None
+        entry["last_used"] = time.time()
+        return entry
+
+    def put(self, key, output_path, tier, pages):
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        shutil.copyfile(output_path, entry_path)
+        self.entries[key] = {"size": os.path.getsize(entry_path), "last_used": time.time(),
+                             "tier": tier, "pages": pages}
+
+    def save(self):
+        """Evicts least recently used entries above max_bytes and persists the index."""
+        total = sum(entry["size"] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries.pop(key)["size"]
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+        self.files = {path: known for path, known in self.files.items() if os.path.exists(path)}
+
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILENAME)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "entries": self.entries}, f)
+        os.replace(tmp_path, index_path) # Atomic, so an interrupted run never corrupts the index
+
+
+# --- Batch Processing ---
+_worker_extractors = {} # One PDFOutlineExtractor per worker process (and settings)
+
+
+def _get_worker_extractor(settings=None):
+    """Returns this process's extractor, with the given attribute overrides applied."""
+    key = tuple(sorted((settings or {}).items()))
+    extractor = _worker_extractors.get(key)
+    if extractor is None:
+        extractor = PDFOutlineExtractor()
+        for name, value in key:
+            setattr(extractor, name, value)
+        _worker_extractors[key] = extractor
+    return extractor
+
+
+def process_pdf(pdf_path, output_path, shard_workers=1, settings=None, stream=False):
+    """
+    Extracts the outline of one PDF and writes it to output_path.
+    settings optionally overrides PDFOutlineExtractor attributes (e.g. use_embedded_outline).
+    With stream=True the outline is written as NDJSON records while it is produced
+    (see PDFOutlineExtractor.iter_outline_records) instead of as one JSON document.
+    Never raises: failures are reported in the returned per-file record.
+    """
+    filename = os.path.basename(pdf_path)
+    record = {"file": filename, "status": "ok", "tier": None, "pages": 0, "seconds": 0.0, "output": output_path,
+              "cached": False}
+    start = time.perf_counter()
+    logger.info(f"Processing {pdf_path}...")
+    try:
+        extractor = _get_worker_extractor(settings)
+        if stream:
+            # Records go to a temporary file that is renamed into place only on success,
+            # so a failed PDF never leaves an empty or partial <name>.ndjson behind
+            tmp_path = output_path + ".part"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for outline_record in extractor.iter_outline_records(pdf_path):
+                        f.write(json.dumps(outline_record, ensure_ascii=False) + "\n")
+                        f.flush() # Make each record visible to downstream readers right away
+                os.replace(tmp_path, output_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        else:
+            result = extractor.extract_outline(pdf_path, shard_workers=shard_workers)
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        record["pages"] = extractor.last_page_count
+        record["tier"] = extractor.last_tier
+        logger.info(f"Successfully processed {filename}. Output saved to {output_path}")
+    except Exception as e:
+        logger.error(f"Error processing {filename}: {e}", exc_info=True) # exc_info to print traceback
+        record.update(status="error", error=str(e), output=None)
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def _failed_record(pdf_path, output_path, error):
+    """Record of a file whose worker died or was stopped; removes the NDJSON .part file it may have left."""
+    if os.path.exists(output_path + ".part"):
+        os.remove(output_path + ".part")
+    return {"file": os.path.basename(pdf_path), "status": "error", "tier": None, "pages": 0, "seconds": 0.0,
+            "output": None, "cached": False, "error": error}
+
+
+def _timed_out_record(pdf_path, output_path, file_timeout):
+    logger.error(f"Timed out after {file_timeout}s while processing {os.path.basename(pdf_path)}")
+    return _failed_record(pdf_path, output_path, f"timed out after {file_timeout}s")
+
+
+def _terminate_pool(pool):
+    """Stops a pool whose workers may be stuck (a hung PDF never returns) by killing its processes."""
+    for process in list(pool._processes.values()): # The executor has no public way to stop a busy worker
+        process.terminate()
+    pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _run_isolated(task, pdf_path, output_path, file_timeout=None):
+    """Re-runs a crash suspect alone in its own single-worker pool."""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        try:
+            return pool.submit(task, pdf_path, output_path).result(timeout=file_timeout)
+        except BrokenProcessPool:
+            logger.error(f"Worker process crashed while processing {os.path.basename(pdf_path)}")
+            return _failed_record(pdf_path, output_path, "worker process crashed")
+        except FutureTimeoutError:
+            _terminate_pool(pool)
+            return _timed_out_record(pdf_path, output_path, file_timeout)
+
+
+def run_batch(jobs, workers, shard_workers=1, settings=None, stream=False, file_timeout=None):
+    """
+    Processes (pdf_path, output_path) jobs and returns one record per job, in job order.
+
+    With workers > 1, or a file_timeout, the jobs run in a process pool with at most
+    `workers` files in flight. If a worker dies (e.g. a segfault inside MuPDF) the files
+    that were in flight are retried one at a time in isolation, so a single bad PDF is
+    reported as failed without taking the rest of the batch down with it. A file still
+    running after file_timeout seconds (e.g. hung inside MuPDF) is reported as failed
+    too: the pool's processes are killed and the other files in flight start over in a
+    fresh pool.
+
+    shard_workers > 1 additionally splits each large document into page ranges that
+    are parsed in parallel (see PDFOutlineExtractor.extract_outline).
+    """
+    task = partial(process_pdf, shard_workers=shard_workers, settings=settings, stream=stream)
+    records = [None] * len(jobs)
+    if workers <= 1 and file_timeout is None: # Without a time limit, a single worker runs in-process
+        for index, (pdf_path, output_path) in enumerate(jobs):
+            records[index] = task(pdf_path, output_path)
+        return records
+
+    queue = deque(range(len(jobs)))
+    suspects = deque()
+    while queue or suspects:
+        if suspects:
+            index = suspects.popleft()
+            records[index] = _run_isolated(task, *jobs[index], file_timeout)
+            continue
+
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            in_flight = {} # future -> job index
+            deadlines = {} # future -> time.monotonic() by which it must be done (with a file_timeout)
+            while queue or in_flight:
+                while queue and len(in_flight) < max(1, workers):
+                    index = queue.popleft()
+                    future = pool.submit(task, *jobs[index])
+                    in_flight[future] = index
+                    if file_timeout is not None:
+                        deadlines[future] = time.monotonic() + file_timeout
+
+                time_left = max(0.0, min(deadlines.values()) - time.monotonic()) if deadlines else None
+                done, _ = wait(in_flight, timeout=time_left, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    index = in_flight.pop(future)
+                    deadlines.pop(future, None)
+                    try:
+                        records[index] = future.result()
+                    except BrokenProcessPool:
+                        suspects.append(index)
+                        broken = True
+
+                if broken:
+                    # Everything still in flight died with the pool; retry those in isolation
+                    suspects.extend(sorted(in_flight.values()))
+                    logger.warning(f"Worker pool crashed; retrying {len(suspects)} file(s) in isolation.")
+                    break
+
+                expired = [future for future, deadline in deadlines.items() if time.monotonic() >= deadline]
+                if expired:
+                    for future in expired:
+                        index = in_flight.pop(future)
+                        del deadlines[future]
+                        records[index] = _timed_out_record(*jobs[index], file_timeout)
+                    # A hung worker never returns: kill the pool and start the files it was running over
+                    queue.extendleft(sorted(in_flight.values(), reverse=True))
+                    _terminate_pool(pool)
+                    break
+    return records
+
+
+def lookup_cached(cache, jobs, fingerprint, output_format):
+    """
+    Serves jobs from the result cache. Returns (records, misses) where records has a
+    record for every hit (None elsewhere) and misses maps job index -> cache key.
+    """
+    records = [None] * len(jobs)
+    misses = {}
+    for index, (pdf_path, output_path) in enumerate(jobs):
+        start = time.perf_counter()
+        try:
+            key = cache.key(cache.content_hash(pdf_path), fingerprint, output_format)
+        except OSError as e:
+            logger.warning(f"Could not hash {pdf_path} for the cache: {e}")
+            misses[index] = None
+            continue
+        entry = cache.get(key, output_path)
+        if entry is None:
+            misses[index] = key
+            continue
+        records[index] = {"file": os.path.basename(pdf_path), "status": "ok", "tier": entry["tier"],
+                          "pages": entry["pages"], "seconds": round(time.perf_counter() - start, 4),
+                          "output": output_path, "cached": True}
+    return records, misses
+
+
+def summarize_batch(records, wall_seconds, workers, processing_seconds):
+    """
+    Builds the throughput summary written next to the batch outputs. Throughput counts
+    only the files actually processed (cache hits excluded) over processing_seconds, the
+    time spent in run_batch; cache hits are reported separately.
+    """
+    succeeded = [r for r in records if r["status"] == "ok"]
+    total_pages = sum(r["pages"] for r in succeeded)
+    processed = [r for r in succeeded if not r["cached"]]
+    processed_pages = sum(r["pages"] for r in processed)
+    cached = len(succeeded) - len(processed)
+    tiers = {}
+    for r in succeeded:
+        tiers[r["tier"]] = tiers.get(r["tier"], 0) + 1
+    return {
+        "workers": workers,
+        "documents": len(records),
+        "succeeded": len(succeeded),
+        "failed": len(records) - len(succeeded),
+        "pages": total_pages,
+        "tiers": tiers, # How many documents each tier (bookmarks / heuristic) produced
+        "cached": cached,
+        "cache_hit_rate": round(cached / len(records), 4) if records else 0.0,
+        "processed": len(processed),
+        "processed_pages": processed_pages,
+        "wall_seconds": round(wall_seconds, 4),
+        "processing_seconds": round(processing_seconds, 4),
+        "documents_per_second": round(len(processed) / processing_seconds, 4) if processing_seconds > 0 else 0.0,
+        "pages_per_second": round(processed_pages / processing_seconds, 4) if processing_seconds > 0 else 0.0,
+        "files": records,
+    }
+
+
+# --- Main Execution Logic ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract title and H1-H3 outline from every PDF in a directory.")
+    parser.add_argument("--input-dir", default=INPUT_DIR, help="Directory containing the PDFs to process.")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="Directory the JSON outlines are written to.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (1 processes the files serially in-process).")
+    parser.add_argument("--shard-workers", type=int, default=1,
+                        help="Worker processes used to parse page ranges of a single large PDF in parallel.")
+    parser.add_argument("--no-bookmarks", action="store_true",
+                        help="Ignore embedded PDF bookmarks and always use the font heuristics.")
+    parser.add_argument("--ndjson", action="store_true",
+                        help="Stream each outline as NDJSON (<name>.ndjson) with bounded memory instead of writing JSON "
+                             "(cannot be combined with --shard-workers).")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory of the persistent result cache.")
+    parser.add_argument("--cache-max-mb", type=int, default=CACHE_MAX_MB, help="Size bound of the result cache in MB.")
+    parser.add_argument("--no-cache", action="store_true", help="Reprocess every PDF without reading or filling the cache.")
+    parser.add_argument("--file-timeout", type=float, default=FILE_TIMEOUT_SECONDS,
+                        help="Seconds after which a PDF that is still being processed is reported as failed (0 disables).")
+    parser.add_argument("--summary", default=None,
+                        help=f"Path of the batch throughput summary (default: <output-dir>/{SUMMARY_FILENAME}).")
+    args = parser.parse_args(argv)
+    if args.ndjson and args.shard_workers > 1:
+        # Streaming emits headings page by page in one pass; sharding needs every page range parsed before merging
+        parser.error("--shard-workers cannot be combined with --ndjson (streaming output parses each PDF serially)")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    input_dir, output_dir = args.input_dir, args.output_dir
+
+    if not os.path.exists(input_dir):
+        logger.error(f"Input directory not found: {input_dir}. Please create it and place PDFs inside.")
+        return
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        logger.info(f"Created output directory: {output_dir}")
+
+    # Sorted so that processing, logs and the summary are in a stable order
+    pdf_filenames = sorted(f for f in os.listdir(input_dir) if f.lower().endswith(".pdf"))
+    if not pdf_filenames:
+        logger.warning(f"No PDF files found in the input directory: {input_dir}")
+        return
+
+    extension = ".ndjson" if args.ndjson else ".json"
+    jobs = [
+        (os.path.join(input_dir, filename), os.path.join(output_dir, os.path.splitext(filename)[0] + extension))
+        for filename in pdf_filenames
+    ]
+    settings = {"use_embedded_outline": False} if args.no_bookmarks else None
+
+    start = time.perf_counter()
+    cache = None if args.no_cache else ResultCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    if cache is not None:
+        fingerprint = _get_worker_extractor(settings).config_fingerprint()
+        records, misses = lookup_cached(cache, jobs, fingerprint, extension)
+        logger.info(f"Result cache: {len(jobs) - len(misses)} hit(s), {len(misses)} miss(es)")
+    else:
+        records, misses = [None] * len(jobs), dict.fromkeys(range(len(jobs)))
+
+    pending = sorted(misses)
+    workers = max(1, min(args.workers, len(pending)))
+    processing_seconds = 0.0
+    if pending:
+        logger.info(f"Processing {len(pending)} PDF(s) with {workers} worker(s)...")
+        processing_start = time.perf_counter()
+        batch_records = run_batch([jobs[index] for index in pending], workers, max(1, args.shard_workers),
+                                  settings, args.ndjson, args.file_timeout or None)
+        processing_seconds = time.perf_counter() - processing_start
+        for index, record in zip(pending, batch_records):
+            records[index] = record
+            if cache is not None and misses[index] is not None and record["status"] == "ok":
+                cache.put(misses[index], record["output"], record["tier"], record["pages"])
+    if cache is not None:
+        cache.save()
+    summary = summarize_batch(records, time.perf_counter() - start, workers, processing_seconds)
+
+    summary_path = args.summary or os.path.join(output_dir, SUMMARY_FILENAME)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    logger.info(
+        f"Batch finished: {summary['succeeded']}/{summary['documents']} documents ({summary['tiers']}, {summary['cached']} cached), {summary['pages']} pages in "
+        f"{summary['wall_seconds']}s; processed {summary['processed']} documents, {summary['processed_pages']} pages in "
+        f"{summary['processing_seconds']}s ({summary['documents_per_second']} docs/s, {summary['pages_per_second']} pages/s). "
+        f"Summary saved to {summary_path}"
+    )
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,99 @@
+# Boilerplate stripping and chunk de-duplication ahead of the encoder.
+# Used by main.py: repeated page furniture is dropped before chunking, and ranked results
+# skip chunks that duplicate, exactly or nearly, a better-ranked chunk.
+import re
+import zlib
+import hashlib
+from collections import Counter
+import numpy as np
+
+_DIGITS_RE = re.compile(r"\d+")
+_SHORT_LINE = 80 # Digits are ignored when comparing lines up to this length (page numbers, running headers)
+_MERSENNE_PRIME = (1 << 31) - 1 # MinHash permutations are (a * x + b) mod this prime
+
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of a text, used for exact duplicate detection."""
+    return " ".join(text.lower().split())
+
+
+def line_key(line):
+    """Form under which lines are compared for repetition: case-insensitive, digits ignored in short lines."""
+    line = line.strip().lower()
+    return _DIGITS_RE.sub("#", line) if len(line) <= _SHORT_LINE else line
+
+
+def repeated_lines(pages, min_pages=3, min_fraction=0.4):
+    """
+    Keys (see line_key) of the boilerplate lines of one document, given its (page_number, text)
+    pairs: lines that occur on at least min_pages pages and at least min_fraction of all pages,
+    such as running headers, footers, page numbers ("Page 3 of 10" matches "Page 4 of 10")
+    and repeated notices.
+    """
+    occurrences = Counter()
+    for _, text in pages:
+        occurrences.update({line_key(line) for line in text.splitlines()} - {""})
+    min_count = max(min_pages, min_fraction * len(pages))
+    return {key for key, count in occurrences.items() if count >= min_count}
+
+
+def strip_repeated_lines(pages, min_pages=3, min_fraction=0.4):
+    """
+    Removes the boilerplate lines (see repeated_lines) from the (page_number, text) pairs
+    of one document. Returns a list of (page_number, text).
+    """
+    pages = list(pages)
+    boilerplate = repeated_lines(pages, min_pages, min_fraction)
+    if not boilerplate:
+        return pages
+    return [(page_num, "\n".join(line for line in text.splitlines() if line_key(line) not in boilerplate))
+            for page_num, text in pages]
+
+
+class ChunkDeduplicator:
+    """
+    Recognizes chunk texts that duplicate a text seen before: one with the same normalized
+    text (exact duplicate), or one whose MinHash signature over word shingles agrees with
+    its own on at least `threshold` of its positions (near duplicate, found through LSH
+    banding). Counts chunks, exact and near duplicates seen so far.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=64, bands=16, shingle_size=3, seed=0):
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.threshold = threshold
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self._exact = set()   # sha1 of the normalized texts seen
+        self._buckets = {}    # (band, band of signature) -> ids of distinct texts
+        self._signatures = [] # MinHash signature of each distinct text
+        self.chunks = self.exact = self.near = 0
+
+    def signature(self, text):
+        words = normalize_text(text).split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles)) % _MERSENNE_PRIME
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+    def is_duplicate(self, text):
+        """Returns True if text duplicates a text seen before; otherwise remembers text and returns False."""
+        self.chunks += 1
+        key = hashlib.sha1(normalize_text(text).encode("utf-8")).digest()
+        if key in self._exact:
+            self.exact += 1
+            return True
+        self._exact.add(key)
+        signature = self.signature(text)
+        band_keys = [(band, values.tobytes()) for band, values in enumerate(signature.reshape(self.bands, -1))]
+        candidates = sorted({rep for band_key in band_keys for rep in self._buckets.get(band_key, ())})
+        for rep in candidates:
+            if np.mean(self._signatures[rep] == signature) >= self.threshold:
+                self.near += 1
+                return True
+        rep = len(self._signatures)
+        self._signatures.append(signature)
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(rep)
+        return False
@@ -0,0 +1,246 @@
+# Incremental on-disk corpus: the chunks and chunk embeddings of every PDF in PDF_DIR,
+# with a manifest that lets main.py reprocess only PDFs that were added or changed.
+import os
+import json
+import mmap
+import hashlib
+import numpy as np
+
+CORPUS_VERSION = 1
+COMPACT_DEAD_FRACTION = 0.25 # Rewrite the files once this share of the rows belongs to removed documents
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CorpusChunks:
+    """
+    Read-only sequence of the corpus chunk dicts, in corpus order. Records are decoded
+    from the memory-mapped chunks file on access, so only the chunks that are actually
+    looked at (e.g. the winners of a query) are ever parsed.
+    """
+
+    def __init__(self, records, offsets, rows, fingerprint):
+        self._records = records # mmap of the chunks file (or b"" when empty)
+        self._offsets = offsets # Byte offset of each stored row, plus the end of the file
+        self._rows = rows       # Stored row of each corpus position
+        self.fingerprint = fingerprint # Identifies the chunk texts, in order (see CorpusStore.fingerprint)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        row = self._rows[int(i)]
+        return json.loads(self._records[self._offsets[row]:self._offsets[row + 1]])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class CorpusStore:
+    """
+    Corpus laid out as flat files in <root_dir>/, one set per generation <g>:
+
+        vectors.<g>.f32  float32 (rows, dim) chunk embeddings
+        chunks.<g>.jsonl one JSON chunk record per row, same order
+        offsets.<g>.i64  byte offset of each row's record in the chunks file
+        manifest.json    {"version", "settings", "generation", "dim", "rows", "documents"};
+                         written last, so rows past "rows" (left over from an
+                         interrupted update) are ignored and truncated on load
+
+    "documents" maps each PDF filename to its size, mtime_ns, sha256 and the range
+    [start, end) of rows holding its chunks, in corpus order. A document's rows are
+    always contiguous; replacing or removing a document leaves its old rows dead until
+    compaction writes the next generation. Files are only ever appended to or replaced,
+    never rewritten in place, so arrays returned by corpus() stay valid.
+    """
+
+    def __init__(self, root_dir, settings):
+        self.dir = root_dir
+        self.settings = settings # Model, chunker version...: any change invalidates every document
+        os.makedirs(self.dir, exist_ok=True)
+        self.generation = 0
+        self.dim = None
+        self.rows = 0
+        self.documents = {}
+        self._pending = {} # filename -> (size, mtime_ns, sha256) of documents planned for processing
+        self._load()
+
+    # --- File layout ---
+    def _path(self, name, generation=None):
+        stem, ext = name.split(".")
+        return os.path.join(self.dir, f"{stem}.{self.generation if generation is None else generation}.{ext}")
+
+    def _load(self):
+        meta_path = os.path.join(self.dir, "manifest.json")
+        manifest = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        if manifest and manifest.get("version") == CORPUS_VERSION and manifest.get("settings") == self.settings:
+            self.generation, self.dim, self.rows = manifest["generation"], manifest["dim"], manifest["rows"]
+            self.documents = manifest["documents"]
+        else:
+            self.generation = (manifest or {}).get("generation", -1) + 1 # Start over in a fresh generation
+        with open(self._path("offsets.i64"), "ab") as f:
+            f.truncate(8 * self.rows)
+        offsets = np.fromfile(self._path("offsets.i64"), dtype=np.int64)
+        records_end = int(offsets[-1]) + len(self._record_at(offsets[-1])) if self.rows else 0
+        for name, size in (("vectors.f32", 4 * (self.dim or 0) * self.rows), ("chunks.jsonl", records_end)):
+            with open(self._path(name), "ab") as f:
+                f.truncate(size) # Drop anything an interrupted update left past the committed rows
+        self._remove_other_generations()
+
+    def _record_at(self, offset):
+        with open(self._path("chunks.jsonl"), "rb") as f:
+            f.seek(offset)
+            return f.readline()
+
+    def _remove_other_generations(self):
+        current = f".{self.generation}."
+        for name in os.listdir(self.dir):
+            if name.split(".")[0] in ("vectors", "chunks", "offsets") and current not in name:
+                os.remove(os.path.join(self.dir, name))
+
+    def _write_manifest(self):
+        meta_path = os.path.join(self.dir, "manifest.json")
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CORPUS_VERSION, "settings": self.settings, "generation": self.generation,
+                       "dim": self.dim, "rows": self.rows, "documents": self.documents}, f)
+        os.replace(tmp_path, meta_path)
+
+    # --- Change detection ---
+    def plan(self, pdf_paths):
+        """
+        Compares {filename: path} against the manifest. Returns (unchanged, changed, removed)
+        filename lists; changed covers new files and files whose content hash differs.
+        Files are only hashed when their size or mtime differ from the manifest.
+        """
+        unchanged, changed = [], []
+        self._pending = {}
+        for name, path in pdf_paths.items():
+            stat = os.stat(path)
+            entry = self.documents.get(name)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                unchanged.append(name)
+                continue
+            sha256 = file_sha256(path)
+            if entry and entry["sha256"] == sha256:
+                entry["size"], entry["mtime_ns"] = stat.st_size, stat.st_mtime_ns # Touched, not modified
+                unchanged.append(name)
+            else:
+                self._pending[name] = (stat.st_size, stat.st_mtime_ns, sha256)
+                changed.append(name)
+        removed = [name for name in self.documents if name not in pdf_paths]
+        return unchanged, changed, removed
+
+    # --- Updates ---
+    def remove_document(self, name):
+        self.documents.pop(name, None)
+
+    def add_document(self, name, chunks, embeddings=None):
+        """
+        Stores the chunks and embeddings of a planned document, replacing its old rows.
+        chunks=None records a PDF whose extraction failed, so it is not retried until it changes.
+        embeddings=None stores chunk records only (a store used without vectors has dim 0).
+        """
+        size, mtime_ns, sha256 = self._pending.pop(name)
+        self.documents.pop(name, None) # Re-added documents move to the end of the corpus
+        start = self.rows
+        if chunks:
+            if embeddings is None:
+                embeddings = np.zeros((len(chunks), 0), dtype=np.float32)
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(chunks), -1)
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+            records = [json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n" for chunk in chunks]
+            with open(self._path("chunks.jsonl"), "ab") as f:
+                base = f.tell()
+                f.write(b"".join(records))
+            lengths = np.fromiter((len(record) for record in records), dtype=np.int64, count=len(records))
+            offsets = base + np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            with open(self._path("offsets.i64"), "ab") as f:
+                f.write(offsets.astype(np.int64).tobytes())
+            with open(self._path("vectors.f32"), "ab") as f:
+                f.write(embeddings.tobytes())
+            self.rows += len(chunks)
+        self.documents[name] = {"size": size, "mtime_ns": mtime_ns, "sha256": sha256,
+                                "start": start, "end": self.rows, "failed": chunks is None}
+
+    def commit(self):
+        """Persists the manifest, compacting first if too many rows belong to removed documents. Returns rows dropped."""
+        live_rows = sum(entry["end"] - entry["start"] for entry in self.documents.values())
+        dead_rows = self.rows - live_rows
+        if dead_rows and dead_rows > COMPACT_DEAD_FRACTION * self.rows:
+            self._compact()
+        else:
+            dead_rows = 0
+        self._write_manifest()
+        self._remove_other_generations()
+        return dead_rows
+
+    def _compact(self):
+        rows = self._live_rows()
+        chunks, _ = self._chunk_file()
+        offsets = np.append(np.fromfile(self._path("offsets.i64"), dtype=np.int64), len(chunks))
+        vectors = self._vectors()
+        generation = self.generation + 1
+        with open(self._path("chunks.jsonl", generation), "wb") as f_chunks:
+            new_offsets = np.empty(len(rows), dtype=np.int64)
+            for i, row in enumerate(rows):
+                new_offsets[i] = f_chunks.tell()
+                f_chunks.write(chunks[offsets[row]:offsets[row + 1]])
+        new_offsets.tofile(self._path("offsets.i64", generation))
+        (np.asarray(vectors[rows]) if len(rows) else np.zeros((0, self.dim or 0), dtype=np.float32)).tofile(self._path("vectors.f32", generation))
+        start = 0
+        for entry in self.documents.values():
+            length = entry["end"] - entry["start"]
+            entry["start"], entry["end"] = start, start + length
+            start += length
+        self.generation, self.rows = generation, len(rows)
+
+    # --- Reads ---
+    def _live_rows(self):
+        ranges = [np.arange(entry["start"], entry["end"], dtype=np.int64) for entry in self.documents.values()]
+        return np.concatenate(ranges) if ranges else np.zeros(0, dtype=np.int64)
+
+    def _chunk_file(self):
+        path = self._path("chunks.jsonl")
+        if not os.path.getsize(path):
+            return b"", None
+        with open(path, "rb") as f:
+            records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return records, path
+
+    def _vectors(self):
+        if not self.rows or not self.dim:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+
+    def fingerprint(self):
+        """Changes whenever the corpus chunk texts or their order change."""
+        digest = hashlib.sha256(json.dumps([CORPUS_VERSION, self.settings], sort_keys=True).encode("utf-8"))
+        for name, entry in self.documents.items():
+            digest.update(json.dumps([name, entry["sha256"], entry["end"] - entry["start"]]).encode("utf-8"))
+        return digest.hexdigest()
+
+    def corpus(self):
+        """
+        Returns (CorpusChunks, embedding matrix) over the live documents in corpus order.
+        Without dead rows the matrix is a read-only view of the memory-mapped vectors.
+        """
+        rows = self._live_rows()
+        records, _ = self._chunk_file()
+        offsets = np.append(np.fromfile(self._path("offsets.i64"), dtype=np.int64, count=self.rows), len(records))
+        vectors = self._vectors()
+        if len(rows) == self.rows:
+            matrix = vectors # rows is 0..rows-1: no gather needed
+        else:
+            matrix = np.asarray(vectors[rows]) if len(rows) else np.zeros((0, self.dim or 0), dtype=np.float32)
+        return CorpusChunks(records, offsets, rows, self.fingerprint()), matrix
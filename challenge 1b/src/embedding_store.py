@@ -0,0 +1,192 @@
+# Persistent, memory-mapped cache of chunk embeddings.
+# Used by main.py so that unchanged chunks are never sent through model.encode twice.
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+
+KEY_SIZE = 32 # sha256 digest length in bytes
+DATA_FILES = ("vectors.f32", "keys.bin", "last_used.f64")
+
+
+def embedding_key(model_name, text):
+    """Cache key of one text: sha256 over the model name and the text."""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+
+def _slug(model_name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name)
+
+
+class EmbeddingStore:
+    """
+    On-disk embedding store for one model, laid out as flat files in
+    <root_dir>/<model>/, one set per generation <g>:
+
+        vectors.<g>.f32    float32 rows of `dim` values, memory-mapped read-only
+        keys.<g>.bin       KEY_SIZE-byte key of each row, in row order
+        last_used.<g>.f64  float64 timestamp of the last lookup of each row
+        meta.json          {"model", "dim", "rows", "generation"}; written last, so rows
+                           past "rows" (left over from an interrupted append) are ignored
+
+    Rows are only ever appended; compact() writes the next generation and switches
+    to it through meta.json, so files that are memory-mapped are never truncated.
+    Lookups return copies made under the store lock.
+    """
+
+    def __init__(self, root_dir, model_name):
+        self.model_name = model_name
+        self.dir = os.path.join(root_dir, _slug(model_name))
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock = threading.Lock() # Lookups and appends may come from several threads
+        self.dim = None
+        self.rows = 0
+        self.generation = 0
+        self._row_of = {}      # key -> row
+        self._vectors = None   # np.memmap of shape (rows, dim)
+        self._last_used = np.zeros(0, dtype=np.float64) # Updated in memory, persisted by flush()
+        self.encoded_last_call = 0 # How many texts the last encode() actually sent to the model
+        self._load()
+
+    # --- File layout ---
+    def _path(self, name, generation=None):
+        stem, ext = name.split(".")
+        return os.path.join(self.dir, f"{stem}.{self.generation if generation is None else generation}.{ext}")
+
+    def _load(self):
+        meta_path = os.path.join(self.dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if "generation" not in meta: # Written before generations existed: adopt its files as generation 0
+            for name in DATA_FILES:
+                if os.path.exists(os.path.join(self.dir, name)):
+                    os.replace(os.path.join(self.dir, name), self._path(name, 0))
+        self.dim, self.rows, self.generation = meta["dim"], meta["rows"], meta.get("generation", 0)
+        # Drop anything an interrupted append left past the committed row count
+        for name, row_size in (("vectors.f32", 4 * self.dim), ("keys.bin", KEY_SIZE), ("last_used.f64", 8)):
+            with open(self._path(name), "ab") as f:
+                f.truncate(self.rows * row_size)
+        self._remove_other_generations() # Left over from an interrupted compaction
+        with open(self._path("keys.bin"), "rb") as f:
+            keys = f.read()
+        self._row_of = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(self.rows)}
+        self._last_used = np.fromfile(self._path("last_used.f64"), dtype=np.float64, count=self.rows)
+        self._map()
+
+    def _map(self):
+        if self.rows:
+            self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        else:
+            self._vectors = None
+
+    def _write_meta(self):
+        meta_path = os.path.join(self.dir, "meta.json")
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "rows": self.rows, "generation": self.generation}, f)
+        os.replace(tmp_path, meta_path)
+
+    def _remove_other_generations(self):
+        current = f".{self.generation}."
+        for name in os.listdir(self.dir):
+            if name.split(".")[0] in ("vectors", "keys", "last_used") and current not in name:
+                os.remove(os.path.join(self.dir, name))
+
+    # --- Lookups ---
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, key):
+        return key in self._row_of
+
+    def _append(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        now = np.full(len(keys), time.time(), dtype=np.float64)
+        with open(self._path("vectors.f32"), "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self._path("keys.bin"), "ab") as f:
+            f.write(b"".join(keys))
+        with open(self._path("last_used.f64"), "ab") as f:
+            f.write(now.tobytes())
+        for offset, key in enumerate(keys):
+            self._row_of[key] = self.rows + offset
+        self.rows += len(keys)
+        self._last_used = np.concatenate([self._last_used, now])
+        self._write_meta()
+        self._map()
+
+    def _gather(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        self._last_used[rows] = time.time()
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+            return np.array(self._vectors[rows[0]:rows[-1] + 1]) # Contiguous: one copy of a slice
+        return np.asarray(self._vectors[rows])
+
+    def encode(self, model, texts, **encode_kwargs):
+        """
+        Returns the embeddings of texts as a (len(texts), dim) float32 array, sending
+        only texts that are not stored yet (each distinct text once) to model.encode.
+        The array is a copy, made under the store lock, so a later compact() cannot touch it.
+        """
+        keys = [embedding_key(self.model_name, text) for text in texts]
+        with self._lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._row_of and key not in missing:
+                    missing[key] = text
+            if missing:
+                vectors = model.encode(list(missing.values()), **encode_kwargs)
+                self._append(list(missing), np.asarray(vectors).reshape(len(missing), -1))
+            self.encoded_last_call = len(missing)
+            return self._gather([self._row_of[key] for key in keys])
+
+    # --- Maintenance ---
+    def flush(self):
+        """Persists the last-used timestamps updated by lookups."""
+        with self._lock:
+            if self.rows:
+                self._last_used.tofile(self._path("last_used.f64"))
+
+    def compact(self, keep_keys=None, max_rows=None):
+        """
+        Rewrites the store keeping only keys in keep_keys (if given) and, of those, at
+        most max_rows most recently used rows. Returns the number of rows dropped.
+        """
+        with self._lock:
+            rows = np.arange(self.rows)
+            if keep_keys is not None:
+                rows = np.array(sorted(self._row_of[key] for key in set(keep_keys) if key in self._row_of), dtype=np.int64)
+            if max_rows is not None and len(rows) > max_rows:
+                newest = np.argsort(self._last_used[rows], kind="stable")[-max_rows:]
+                rows = np.sort(rows[newest])
+            dropped = self.rows - len(rows)
+            if not dropped:
+                return 0
+
+            keys_by_row = {row: key for key, row in self._row_of.items()}
+            keys = [keys_by_row[row] for row in rows]
+            vectors = np.array(self._vectors[rows]) if len(rows) else np.zeros((0, self.dim or 0), dtype=np.float32)
+            last_used = self._last_used[rows].copy()
+
+            # Written as the next generation beside the current files, which stay intact
+            # (and validly mapped) until meta.json switches over to the new ones
+            generation = self.generation + 1
+            vectors.astype(np.float32).tofile(self._path("vectors.f32", generation))
+            with open(self._path("keys.bin", generation), "wb") as f:
+                f.write(b"".join(keys))
+            last_used.tofile(self._path("last_used.f64", generation))
+
+            self.generation = generation
+            self.rows = len(rows)
+            self._row_of = {key: row for row, key in enumerate(keys)}
+            self._last_used = last_used
+            self._write_meta()
+            self._map()
+            self._remove_other_generations()
+            return dropped
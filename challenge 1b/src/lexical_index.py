@@ -0,0 +1,73 @@
+# In-memory BM25 inverted index over chunk texts.
+# Used by main.py's lexical prefilter to pick the chunks worth embedding for a persona.
+import re
+from array import array
+from collections import Counter
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their this to was were "
+    "which with will we our can these those such than also been not but all any each other".split()
+)
+
+
+def tokenize(text):
+    """Lower-cased alphanumeric terms of text, without stopwords and single characters."""
+    return [term for term in TOKEN_RE.findall(text.lower()) if len(term) > 1 and term not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of texts (one posting list of (text id, term frequency)
+    per term). k1 and b are the usual saturation and length-normalization parameters.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {} # term -> (ids int32 array, term frequencies float32 array)
+        self.lengths = np.zeros(0, dtype=np.float32)
+        self.avg_length = 0.0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @classmethod
+    def build(cls, texts, k1=1.5, b=0.75):
+        index = cls(k1, b)
+        ids, frequencies, lengths = {}, {}, array("f")
+        for text_id, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                if term not in ids:
+                    ids[term], frequencies[term] = array("i"), array("f")
+                ids[term].append(text_id)
+                frequencies[term].append(count)
+        index.postings = {term: (np.frombuffer(ids[term], dtype=np.int32), np.frombuffer(frequencies[term], dtype=np.float32)) for term in ids}
+        index.lengths = np.frombuffer(lengths, dtype=np.float32) if len(lengths) else np.zeros(0, dtype=np.float32)
+        index.avg_length = float(index.lengths.mean()) if len(index.lengths) else 0.0
+        return index
+
+    def scores(self, query):
+        """BM25 score of every text for the query string (each distinct query term counted once)."""
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        if not len(self.lengths):
+            return scores
+        length_norm = self.k1 * (1.0 - self.b + self.b * self.lengths / max(self.avg_length, 1e-9))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            ids, frequencies = self.postings[term]
+            idf = np.log1p((len(self.lengths) - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * frequencies * (self.k1 + 1.0) / (frequencies + length_norm[ids])
+        return scores
+
+    def top(self, query, n):
+        """Ids of the (at most) n best-scoring texts with a positive score, best first."""
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
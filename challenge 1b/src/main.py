@@ -1,12 +1,30 @@
-# pip install PyPDF2
+# pip install PyMuPDF
 # pip install sentence-transformers
+# Heavy dependencies (sentence-transformers, PyMuPDF) are imported on first use, so importing
+# this module or running --help is near-instant.
 import os
+import time
 import datetime
 import json
-from PyPDF2 import PdfReader # Assuming you're using PyPDF2 for PDF reading
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import queue
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+import importlib.util
+from itertools import groupby
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import numpy as np
 import re # For cleaning text
+from embedding_store import EmbeddingStore # Persistent chunk embedding cache
+from corpus_store import CorpusStore # Incremental per-PDF chunks and embeddings
+from lexical_index import BM25Index # Lexical prefilter
+from chunk_dedup import ChunkDeduplicator, line_key, repeated_lines, strip_repeated_lines # Boilerplate stripping and chunk de-duplication
+from vector_index import IVFIndex, recall_report # Approximate nearest-neighbour index
 # # --- Configuration ---
 # # IMPORTANT: For local execution, place your PDF files in a 'pdfs' subfolder
 # # relative to where you run this script.
@@ -26,21 +44,51 @@ import re # For cleaning text
 PDF_DIR = "./pdfs/"  # Change this line from the absolute Windows path
 OUTPUT_DIR = "./output/" # Change this line from the absolute Windows path
 
-# Create output directory if it doesn't exist
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(PDF_DIR, exist_ok=True) # Ensure pdfs dir also exists, in case user forgets
-
-# Create output directory if it doesn't exist
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(PDF_DIR, exist_ok=True) # Ensure pdfs dir also exists, in case user forgets
+# PDF_DIR and OUTPUT_DIR are created when a run first needs them (see load_corpus and save_output)
 # Model configuration
-MODEL_PATH = 'all-MiniLM-L6-v2' # This is the model identifier for SentenceTransformer
-# Load the SentenceTransformer model once globally
-print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Loading SentenceTransformer model from: {MODEL_PATH}")
-model = SentenceTransformer(MODEL_PATH)
-print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Model loaded successfully.")
+MODEL_PATH = 'all-MiniLM-L6-v2' # This is the model identifier for SentenceTransformer (loaded once, on first use)
+# Embedding cache: chunk vectors keyed by model name + chunk text hash, reused across runs and personas
+EMBEDDING_CACHE_DIR = "./embedding_cache/"
+EMBEDDING_CACHE_MAX_ROWS = 500000 # Least recently used vectors beyond this are compacted away
+# Incremental corpus: chunks and embeddings of each PDF in PDF_DIR, reprocessed only when the file changes
+CORPUS_INDEX_DIR = "./corpus_index/"
+CHUNKER_VERSION = 5 # Bump when extraction or chunking changes, so that every PDF is processed again
+# Section chunking: each PDF is parsed once by challenge 1a's outline extractor (spans, pages and outline)
+# and chunked by outline section. If that file is missing, page text is chunked in fixed windows instead.
+OUTLINE_EXTRACTOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "challenge 1a", "main.py")
+SECTION_CHUNK_SIZE = 512 # Characters per chunk; longer sections are split into windows. Keep well under the
+                         # encoder's 256-token input limit (~1000 characters), beyond which text is silently cut off
+SECTION_CHUNK_OVERLAP = 20 # Words shared by consecutive windows of one section
+DEDUP_NEAR_THRESHOLD = 0.9 # MinHash agreement at which a ranked chunk is dropped as a near duplicate of a better one
+# Corpus pipeline: PDFs are parsed/chunked in worker processes while the encoder embeds earlier documents
+PARSE_WORKERS = os.cpu_count() or 1 # Processes that extract and chunk PDFs (1 parses in a background thread)
+# Parse workers start fresh rather than forked: the pool is created from a background thread while other
+# threads (the encoder, daemon handlers) may hold locks that a forked child would inherit locked
+PARSE_START_METHOD = "spawn"
+PIPELINE_QUEUE_DEPTH = 8 # Parsed documents buffered between the parse and encode stages
+EMBED_BATCH_SIZE = 256 # Chunks gathered across documents per encoder call
+MODEL_BATCH_SIZE = 32 # Batch size SentenceTransformer uses inside each encoder call
 # Cosine similarity threshold for relevance (adjust as needed)
 THRESHOLD = 0.5 # Consider temporarily lowering to 0.1 for debugging if no results appear
+# Top-k selection: keep only the K most similar chunks (None keeps all above THRESHOLD).
+# Set THRESHOLD = None and TOP_K = K for pure top-k mode.
+TOP_K = None
+_CONFIGURED = object() # Default of the threshold / top_k parameters: use THRESHOLD / TOP_K as set at call time
+# Approximate nearest-neighbour index over the chunk embeddings, built offline with --build-index.
+# Used instead of brute-force scoring in top-k mode (TOP_K set) while it matches the corpus.
+VECTOR_INDEX_DIR = "./vector_index/"
+VECTOR_INDEX_NPROBE = 16 # Inverted lists scanned per query: higher is slower but closer to exact
+VECTOR_INDEX_QUANTIZE = False # Store int8 codes instead of float32 vectors (4x smaller, slightly lower recall)
+VECTOR_INDEX_RECALL_QUERIES = 100 # Corpus chunks sampled as extra queries for the recall report
+# Lexical prefilter (two-stage retrieval): BM25 over the chunk texts picks PREFILTER_CANDIDATES chunks per
+# persona and only those are embedded and re-ranked. Measure what it costs in recall with --prefilter-report.
+LEXICAL_PREFILTER = False
+PREFILTER_CANDIDATES = 300
+# Query daemon (--serve): keeps the model and corpus embeddings warm and answers persona queries over localhost HTTP
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = 8765
+DAEMON_WORKERS = 4 # Requests handled concurrently
+DAEMON_MAX_PENDING = 16 # Requests waiting for a worker; beyond that the daemon answers 503
 # Define personas (customize this as per your application's needs)
 personas_data = {
     "Data Scientist": {
@@ -54,176 +102,924 @@ personas_data = {
         "job_to_be_done": "Prepare a comprehensive literature review focusing on methodologies, datasets, and performance benchmarks",
     },}
     # Add more personas as needed
-# --- Helper Functions (You likely have these or similar) ---
+# --- Lazily Loaded Resources ---
 
-def extract_text_from_pdf(pdf_path):
-    """Extracts text from a PDF file."""
-    text = ""
-    try:
-        with open(pdf_path, 'rb') as file:
-            reader = PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        return None
-    return text
+_model = None
+_embedding_store = None
+_corpus_stores = {} # embedded -> CorpusStore
+_outline_extractor = None # Challenge 1a's PDFOutlineExtractor, or False if OUTLINE_EXTRACTOR_PATH is missing
+_lazy_lock = threading.Lock() # Guards first-use construction of the model, the embedding cache, the corpus and the extractor
+_encode_lock = threading.Lock() # model.encode is not safe to call from several threads at once (shared tokenizer)
+
+def get_model():
+    """Returns the SentenceTransformer model, importing and loading it on first use."""
+    global _model
+    with _lazy_lock:
+        if _model is None:
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Loading SentenceTransformer model from: {MODEL_PATH}")
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(MODEL_PATH)
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Model loaded successfully.")
+    return _model
+
+def get_embedding_store():
+    """Returns the chunk embedding cache, opening it on first use."""
+    global _embedding_store
+    with _lazy_lock:
+        if _embedding_store is None:
+            _embedding_store = EmbeddingStore(EMBEDDING_CACHE_DIR, MODEL_PATH)
+    return _embedding_store
+
+def get_outline_extractor():
+    """
+    Returns challenge 1a's PDFOutlineExtractor, loading it from OUTLINE_EXTRACTOR_PATH on
+    first use, or None if that file is missing (PDFs are then chunked in page windows).
+    """
+    global _outline_extractor
+    if _outline_extractor is None: # Checked before locking, so the lock is only taken on first use
+        with _lazy_lock:
+            if _outline_extractor is None:
+                if not os.path.exists(OUTLINE_EXTRACTOR_PATH):
+                    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Outline extractor not found at {OUTLINE_EXTRACTOR_PATH}; chunking PDFs in page windows.")
+                    _outline_extractor = False
+                else:
+                    spec = importlib.util.spec_from_file_location("outline_extractor", OUTLINE_EXTRACTOR_PATH)
+                    module = importlib.util.module_from_spec(spec)
+                    spec.loader.exec_module(module)
+                    logging.getLogger("outline_extractor").setLevel(logging.WARNING) # It logs every heading it finds at INFO
+                    _outline_extractor = module.PDFOutlineExtractor()
+    return _outline_extractor or None
+
+def chunker_id():
+    """Identifies how PDFs are chunked; the corpus is rebuilt whenever it changes."""
+    extractor = get_outline_extractor()
+    if extractor is None:
+        return f"{CHUNKER_VERSION}/pages"
+    return f"{CHUNKER_VERSION}/sections/{extractor.config_fingerprint()[:16]}"
 
-def clean_and_chunk_text(text, filename, max_chunk_size=512, overlap=50):
+def get_corpus_store(embedded=True):
     """
-    Cleans text, splits it into manageable chunks, and retains context.
-    Adds filename and page_num (if available and relevant) to each chunk.
+    Returns the incremental corpus, opening it on first use: with chunk embeddings, or
+    (embedded=False, for the lexical prefilter) chunk records only, kept in a separate store.
     """
-    if text is None:
-        return []
+    chunker = chunker_id() # Outside the lock: it may load the extractor, which takes the lock itself
+    with _lazy_lock:
+        if embedded not in _corpus_stores:
+            if embedded:
+                _corpus_stores[embedded] = CorpusStore(CORPUS_INDEX_DIR, {"model": MODEL_PATH, "chunker": chunker})
+            else:
+                _corpus_stores[embedded] = CorpusStore(os.path.join(CORPUS_INDEX_DIR, "lexical"), {"chunker": chunker})
+    return _corpus_stores[embedded]
 
-    # Simple cleaning: remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+def encode_queries(texts):
+    """Encodes persona jobs-to-be-done (never cached): returns one row per text."""
+    model = get_model()
+    with _encode_lock:
+        return np.atleast_2d(model.encode(list(texts), show_progress_bar=False))
 
-    # Split into chunks (you might have more sophisticated chunking logic)
-    # This is a very basic chunking strategy
-    words = text.split()
-    chunks = []
+# --- Helper Functions (You likely have these or similar) ---
+
+def iter_pdf_pages(pdf_path):
+    """
+    Yields (page_number, text) for each page of a PDF, 1-based, one page at a time.
+    Uses PyMuPDF (the same backend as challenge 1a); pages without text are skipped.
+    """
+    import fitz # PyMuPDF; imported here so that importing this module stays fast
+    with fitz.open(pdf_path) as doc:
+        for page_index in range(doc.page_count):
+            text = doc.load_page(page_index).get_text("text")
+            if text.strip():
+                yield page_index + 1, text
+
+def chunk_pages(pages, filename, max_chunk_size=512, overlap=50):
+    """
+    Splits the text of (page_number, text) pairs into overlapping chunks, streaming:
+    only the words of the chunk being built are held in memory.
+    Each chunk records the filename and the first (page_num) and last (page_end) page it spans.
+    """
     current_chunk = []
+    current_pages = [] # Page of each word in current_chunk
     current_length = 0
-    page_num = 1 # Basic page tracking (might need enhancement if your PDF parser gives page info)
-
-    for word in words:
-        if current_length + len(word) + 1 > max_chunk_size and current_chunk:
-            chunks.append({
-                "filename": filename,
-                "page_num": page_num, # Simplified: assume each chunk starts on the same page for now
-                "text_chunk": " ".join(current_chunk)
-            })
-            # For overlap, take the last 'overlap' words
-            current_chunk = current_chunk[-overlap:]
-            current_length = sum(len(w) for w in current_chunk) + len(current_chunk) - 1 if current_chunk else 0
-        current_chunk.append(word)
-        current_length += len(word) + 1 # +1 for space
+
+    for page_num, text in pages:
+        # Simple cleaning: split on any run of whitespace
+        for word in text.split():
+            if current_length + len(word) + 1 > max_chunk_size and current_chunk:
+                yield {
+                    "filename": filename,
+                    "page_num": current_pages[0],
+                    "page_end": current_pages[-1],
+                    "text_chunk": " ".join(current_chunk)
+                }
+                # For overlap, take the last 'overlap' words
+                current_chunk = current_chunk[-overlap:]
+                current_pages = current_pages[-overlap:]
+                current_length = sum(len(w) for w in current_chunk) + len(current_chunk) - 1 if current_chunk else 0
+            current_chunk.append(word)
+            current_pages.append(page_num)
+            current_length += len(word) + 1 # +1 for space
 
     if current_chunk: # Add last chunk
-        chunks.append({
+        yield {
             "filename": filename,
-            "page_num": page_num, # Simplified
+            "page_num": current_pages[0],
+            "page_end": current_pages[-1],
             "text_chunk": " ".join(current_chunk)
+        }
+
+def _page_texts(lines):
+    """Groups (page_number, line) pairs, in order, into (page_number, text) pairs."""
+    return [(page_num, "\n".join(text for _, text in page_lines)) for page_num, page_lines in groupby(lines, key=lambda line: line[0])]
+
+def chunk_document(document, filename, max_chunk_size=SECTION_CHUNK_SIZE, overlap=SECTION_CHUNK_OVERLAP):
+    """
+    Chunks a parsed PDF (challenge 1a's DocumentModel) by outline section, after dropping
+    the lines that repeat across its pages. A section that fits in max_chunk_size characters
+    is one chunk; a longer one is split by chunk_pages into windows that stay inside it.
+    Each chunk also records the section_title of its section.
+    """
+    boilerplate = repeated_lines(_page_texts(document.lines()))
+    for section in document.sections():
+        section_lines = [(page_num, text) for page_num, text in section["lines"] if line_key(text) not in boilerplate]
+        for chunk in chunk_pages(_page_texts(section_lines), filename, max_chunk_size, overlap):
+            chunk["section_title"] = section["title"]
+            yield chunk
+
+def normalize_rows(matrix):
+    """L2-normalizes each row so that dot products are cosine similarities."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12) # Guard against all-zero embeddings
+
+def select_chunks(scores, threshold, top_k):
+    """
+    Picks the winning chunk indices, best first.
+    threshold keeps chunks scoring at or above it; top_k keeps only the K best
+    (found with a partial sort); None disables either. With both set, the threshold
+    is applied first.
+    """
+    candidates = np.arange(len(scores)) if threshold is None else np.flatnonzero(scores >= threshold)
+    if top_k is not None and len(candidates) > top_k:
+        best = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+        candidates = np.sort(candidates[best]) # Back to corpus order so ties rank by position
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+def select_distinct(document_chunks, select, top_k):
+    """
+    Drops the winners that duplicate, exactly or nearly (see ChunkDeduplicator), a better-ranked
+    winner. select(k) returns up to k winning chunk indices, best first (all of them for k=None);
+    k is doubled until top_k distinct winners are found or there are no more winners.
+    Embeddings are never shared: every chunk keeps the vector of its own text.
+    """
+    k = top_k
+    while True:
+        winners = select(k)
+        deduplicator = ChunkDeduplicator(DEDUP_NEAR_THRESHOLD)
+        distinct = [i for i in winners if not deduplicator.is_duplicate(document_chunks[i]['text_chunk'])]
+        if top_k is None or len(distinct) >= top_k or len(winners) < k:
+            return np.array(distinct[:top_k], dtype=np.int64)
+        k *= 2
+
+def build_sections(document_chunks, scores, winners):
+    """
+    Builds (extracted_sections, subsection_analysis) for the winning chunks only.
+    extracted_sections is ranked by score; subsection_analysis follows corpus order.
+    """
+    extracted_sections = []
+    for i in winners:
+        doc_item = document_chunks[i]
+        pages = list(range(doc_item["page_num"], doc_item["page_end"] + 1))
+        page_label = f"Page {pages[0]}" if len(pages) == 1 else f"Pages {pages[0]}-{pages[-1]}"
+        extracted_sections.append({
+            "document": doc_item["filename"],
+            "page_number": pages, # Every page the chunk spans
+            "section_title": doc_item.get("section_title") or f"Relevant Section from {doc_item['filename']} on {page_label}",
+            "importance_rank": float(scores[i]) # Ensure it's a float
         })
-    return chunks
-# --- Main Document Intelligence Function ---
+    sub_section_analysis = []
+    for i in np.sort(winners):
+        doc_item = document_chunks[i]
+        sub_section_analysis.append({
+            "document": doc_item["filename"],
+            "page_number": doc_item["page_num"],
+            "refined_text": doc_item["text_chunk"]
+        })
+    return extracted_sections, sub_section_analysis
 
-def run_document_intelligence_local(selected_persona_name):
-    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Starting Document Intelligence Process...")
+def score_matrix(query_embeddings, chunk_embeddings, chunks_normalized=False):
+    """
+    Cosine similarities of every chunk against every query as one matrix-matrix
+    product: returns an array of shape (num_chunks, num_queries).
+    Pass chunks_normalized=True when chunk_embeddings already has unit-length rows.
+    """
+    queries = normalize_rows(np.atleast_2d(query_embeddings))
+    return (chunk_embeddings if chunks_normalized else normalize_rows(chunk_embeddings)) @ queries.T
 
-    persona_info = personas_data.get(selected_persona_name)
-    if not persona_info:
-        print(f"Error: Persona '{selected_persona_name}' not found.")
-        return {"error": f"Persona '{selected_persona_name}' not found."}
+def select_from_index(ids, index_scores, threshold):
+    """
+    Turns one query's IVFIndex.search results into (winners, scores) for build_sections:
+    winners are the found chunk indices, best first, at or above threshold (if not None).
+    """
+    keep = ids >= 0
+    if threshold is not None:
+        keep &= index_scores >= threshold
+    return ids[keep], dict(zip(ids[keep].tolist(), index_scores[keep].tolist()))
 
-    persona_role = persona_info["role"]
-    persona_expertise = persona_info["expertise"]
-    job_to_be_done = persona_info["job_to_be_done"]
+def rank_corpus(query_embeddings, corpus_chunks, corpus_matrix, corpus_index=None, threshold=_CONFIGURED, top_k=_CONFIGURED, chunks_normalized=False):
+    """
+    Selects and ranks the corpus chunks for each query: searches corpus_index when one
+    is given and top_k is set, otherwise scores every chunk with one matrix-matrix product.
+    threshold and top_k default to THRESHOLD and TOP_K; pass None to disable either.
+    Near-duplicate winners are dropped (see select_distinct).
+    Returns one (extracted_sections, subsection_analysis) pair per query.
+    """
+    threshold = THRESHOLD if threshold is _CONFIGURED else threshold
+    top_k = TOP_K if top_k is _CONFIGURED else top_k
+    query_embeddings = np.atleast_2d(query_embeddings)
+    if not corpus_chunks:
+        return [([], []) for _ in query_embeddings]
+    if corpus_index is not None and top_k is not None:
+        ids, index_scores = corpus_index.search(query_embeddings, top_k, VECTOR_INDEX_NPROBE)
+        ranked = []
+        for q in range(len(query_embeddings)):
+            scores = {}
+            def select(k, q=q):
+                if k == top_k:
+                    found_ids, found_scores = ids[q], index_scores[q]
+                else: # Too many near duplicates among the first top_k: search deeper
+                    (found_ids,), (found_scores,) = corpus_index.search(query_embeddings[q:q + 1], k, VECTOR_INDEX_NPROBE)
+                winners, winner_scores = select_from_index(found_ids, found_scores, threshold)
+                scores.update(winner_scores)
+                return winners
+            winners = select_distinct(corpus_chunks, select, top_k)
+            ranked.append(build_sections(corpus_chunks, scores, winners))
+        return ranked
+    scores = score_matrix(query_embeddings, corpus_matrix, chunks_normalized)
+    return [build_sections(corpus_chunks, scores[:, q], select_distinct(corpus_chunks, lambda k: select_chunks(scores[:, q], threshold, k), top_k))
+            for q in range(len(query_embeddings))]
 
-    # --- Step 1: Load Persona Embedding ---
-    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Encoding persona job-to-be-done...")
-    persona_embedding = model.encode(job_to_be_done)
-    persona_embedding_reshaped = persona_embedding.reshape(1, -1) # Reshape for cosine_similarity
+# --- Lexical Prefilter ---
 
-    # --- Step 2: Discover and Process PDF Files ---
+def persona_query_text(persona_info):
+    """The text the lexical prefilter matches chunks against: role, expertise and job-to-be-done."""
+    return " ".join([persona_info["role"], *persona_info["expertise"], persona_info["job_to_be_done"]])
+
+def build_lexical_index(corpus_chunks):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Building lexical index over {len(corpus_chunks)} chunks...")
+    return BM25Index.build(chunk['text_chunk'] for chunk in corpus_chunks)
+
+def _prefilter_scores(query_embeddings, lexical_queries, corpus_chunks, lexical_index):
+    """
+    Picks up to PREFILTER_CANDIDATES chunks per query with BM25, embeds the distinct
+    candidates once (through the embedding cache, so identical texts are encoded once)
+    and scores them by cosine similarity.
+    Returns (candidate ids per query, their scores per query, number of chunks embedded).
+    """
+    query_embeddings = np.atleast_2d(query_embeddings)
+    candidates = [lexical_index.top(query, PREFILTER_CANDIDATES) for query in lexical_queries]
+    embedded = np.unique(np.concatenate(candidates)) if candidates else np.zeros(0, dtype=np.int64)
+    if not len(embedded):
+        return candidates, [np.zeros(0, dtype=np.float32) for _ in candidates], 0
+    embeddings, _ = _encode_length_sorted([corpus_chunks[i]['text_chunk'] for i in embedded])
+    candidate_scores = [score_matrix(query_embeddings[q], embeddings[np.searchsorted(embedded, ids)])[:, 0]
+                        for q, ids in enumerate(candidates)]
+    return candidates, candidate_scores, len(embedded)
+
+def rank_prefiltered(query_embeddings, lexical_queries, corpus_chunks, lexical_index, threshold=_CONFIGURED, top_k=_CONFIGURED):
+    """
+    Two-stage counterpart of rank_corpus: only the BM25 candidates of each query are
+    embedded and re-ranked. Returns (one (extracted_sections, subsection_analysis) pair
+    per query, number of chunks embedded).
+    """
+    threshold = THRESHOLD if threshold is _CONFIGURED else threshold
+    top_k = TOP_K if top_k is _CONFIGURED else top_k
+    candidates, candidate_scores, embedded_count = _prefilter_scores(query_embeddings, lexical_queries, corpus_chunks, lexical_index)
+    ranked = []
+    for ids, scores in zip(candidates, candidate_scores):
+        winners = ids[select_distinct(corpus_chunks, lambda k: ids[select_chunks(scores, threshold, k)], top_k)] if len(ids) else ids
+        ranked.append(build_sections(corpus_chunks, dict(zip(ids.tolist(), scores.tolist())), winners))
+    return ranked, embedded_count
+
+# --- Vector Index Helpers ---
+
+def load_corpus_index(corpus_chunks):
+    """Returns the saved vector index if it was built from this exact corpus, else None."""
+    corpus_index = IVFIndex.load(VECTOR_INDEX_DIR)
+    if corpus_index is None:
+        return None
+    if corpus_index.fingerprint != corpus_chunks.fingerprint:
+        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Vector index in {VECTOR_INDEX_DIR} is stale (corpus changed); using brute-force scoring. Rebuild it with --build-index.")
+        return None
+    return corpus_index
+
+# --- Corpus Processing and Output Helpers ---
+
+_END_OF_DOCUMENTS = None # Sentinel put on the parse queue once every PDF has been handed over
+_PARSE_CRASHED = object() # Chunks of a PDF whose parse worker process died even when run alone
+
+def _parse_and_chunk(full_pdf_path, pdf_filename):
+    """
+    Parse-stage worker: parses one PDF into challenge 1a's document model (spans, pages and
+    outline, in a single pass) and chunks it by section (see chunk_document). Without the
+    extractor, extracts it page by page, strips the boilerplate lines that repeat across
+    its pages and chunks it in windows. Returns None if extraction failed.
+    """
+    try:
+        # Chunk text (pass filename to chunker to include in chunk metadata)
+        extractor = get_outline_extractor()
+        if extractor is None:
+            return list(chunk_pages(strip_repeated_lines(iter_pdf_pages(full_pdf_path)), pdf_filename))
+        return list(chunk_document(extractor.parse_document(full_pdf_path), pdf_filename))
+    except Exception as e:
+        print(f"Error extracting text from {full_pdf_path}: {e}")
+        return None
+
+def _parse_isolated(pdf_filename):
+    """Re-parses a crash suspect alone in its own single-worker pool; _PARSE_CRASHED if it takes that down too."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context(PARSE_START_METHOD)) as pool:
+        try:
+            return pool.submit(_parse_and_chunk, os.path.join(PDF_DIR, pdf_filename), pdf_filename).result()
+        except BrokenProcessPool:
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Parse worker crashed while processing {pdf_filename}.")
+            return _PARSE_CRASHED
+
+def _produce_parsed_documents(pdf_filenames, parsed_queue, workers, queue_depth):
+    """
+    Producer thread: parses and chunks the PDFs (in a process pool when workers > 1)
+    and puts (pdf_filename, document_chunks) on parsed_queue strictly in input order.
+    At most workers + queue_depth documents are parsed ahead of the encoder.
+
+    If a worker process dies (e.g. a segfault inside MuPDF), the pool breaks and every
+    document in flight is lost with it. The next document in order is then re-parsed alone
+    in its own process and the others are resubmitted to a fresh pool, so only a document
+    that crashes on its own is reported (as _PARSE_CRASHED, not as a failed extraction).
+    """
+    def result_of(pdf_filename, future):
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            print(f"Error extracting text from {pdf_filename}: {e}")
+            return None
+
+    try:
+        if workers <= 1:
+            for pdf_filename in pdf_filenames:
+                parsed_queue.put((pdf_filename, _parse_and_chunk(os.path.join(PDF_DIR, pdf_filename), pdf_filename)))
+            return
+        remaining = deque(pdf_filenames)
+        while remaining:
+            broken = False
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(PARSE_START_METHOD)) as pool:
+                in_flight = deque()
+                try:
+                    while remaining or in_flight:
+                        while remaining and len(in_flight) < workers + queue_depth:
+                            in_flight.append((remaining[0], pool.submit(_parse_and_chunk, os.path.join(PDF_DIR, remaining[0]), remaining[0])))
+                            remaining.popleft()
+                        parsed_queue.put((in_flight[0][0], result_of(*in_flight[0]))) # Blocks while the queue is full
+                        in_flight.popleft()
+                except BrokenProcessPool:
+                    # Everything still in flight died with the pool: isolate the next document, resubmit the rest
+                    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Parse worker pool crashed; retrying {len(in_flight)} PDF(s).")
+                    remaining.extendleft(reversed([pdf_filename for pdf_filename, _ in in_flight]))
+                    broken = True
+            if broken and remaining:
+                pdf_filename = remaining.popleft()
+                parsed_queue.put((pdf_filename, _parse_isolated(pdf_filename)))
+    finally:
+        parsed_queue.put(_END_OF_DOCUMENTS)
+
+def _encode_length_sorted(chunk_texts):
+    """
+    Encodes one batch (through the embedding cache) with the texts sorted by length,
+    so that similarly sized chunks share padded model batches; rows come back in input order.
+    Returns (chunk_embeddings, number of texts that actually went through the model).
+    """
+    order = sorted(range(len(chunk_texts)), key=lambda i: len(chunk_texts[i]), reverse=True)
+    model, embedding_store = get_model(), get_embedding_store()
+    with _encode_lock:
+        vectors = embedding_store.encode(model, [chunk_texts[i] for i in order], batch_size=MODEL_BATCH_SIZE, show_progress_bar=False)
+        newly_encoded = embedding_store.encoded_last_call
+    chunk_embeddings = np.empty_like(vectors)
+    chunk_embeddings[order] = vectors
+    return chunk_embeddings, newly_encoded
+
+def load_corpus(embed=True):
+    """
+    Steps shared by every persona: discover the PDFs in PDF_DIR and bring the incremental
+    corpus (see corpus_store.py) up to date. Only PDFs that are new or changed since the
+    last run, per the manifest (size, mtime, content hash), are extracted, chunked and
+    embedded (through the embedding cache); removed PDFs are dropped.
+
+    Those PDFs run through a two-stage pipeline: a process pool parses and chunks them
+    while the encoder consumes them from a bounded queue, gathering chunks across documents
+    into batches of EMBED_BATCH_SIZE. Documents are consumed in input order and batch
+    boundaries depend only on the corpus, so the result is deterministic. Every chunk is
+    encoded from its own text; identical texts are encoded once (the embedding cache is
+    keyed by text).
+    With embed=False (lexical prefilter) only the chunk records are kept, in their own
+    store, and nothing is embedded; corpus_matrix then has no columns.
+    Returns (input_documents, corpus_chunks, corpus_matrix), or None if there are no PDFs;
+    corpus_chunks is a read-only sequence of chunk dicts (CorpusChunks).
+    """
+    os.makedirs(PDF_DIR, exist_ok=True) # Ensure pdfs dir also exists, in case user forgets
     all_pdf_filenames = [f for f in os.listdir(PDF_DIR) if f.lower().endswith('.pdf')]
     if not all_pdf_filenames:
         print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] No PDF files found in {PDF_DIR}.")
-        return {"error": "No PDF files found."}
+        return None
 
-    # Initialize lists to accumulate results from ALL documents
-    # These will be flat lists as per your desired output structure
-    all_extracted_sections = []
-    all_sub_section_analysis = []
-    input_documents_for_output = [] # To store names of files actually processed
+    input_documents_for_output = list(all_pdf_filenames) # List of all PDFs found and processed
+    corpus_store = get_corpus_store(embedded=embed)
+    unchanged, changed, removed = corpus_store.plan({f: os.path.join(PDF_DIR, f) for f in all_pdf_filenames})
+    for pdf_filename in removed:
+        corpus_store.remove_document(pdf_filename)
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Corpus: {len(unchanged)} unchanged, {len(changed)} new or changed, {len(removed)} removed PDFs.")
 
-    # --- Process each PDF document individually ---
-    for pdf_filename in all_pdf_filenames:
-        full_pdf_path = os.path.join(PDF_DIR, pdf_filename)
-        input_documents_for_output.append(pdf_filename) # Add to list for metadata
+    # Chunks of new/changed documents are embedded in cross-document batches; each document
+    # is handed to the corpus store once all of its chunks have been embedded
+    pending_chunks = []            # Chunks of documents not stored yet, in order
+    pending_documents = deque()    # (pdf_filename, number of chunks) of documents not stored yet
+    encoded_embeddings = []        # Embeddings of pending_chunks[:encoded_chunks]
+    encoded_chunks = 0
+    new_chunks = 0
+    processed_chunks = 0
 
-        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Processing PDF: {pdf_filename}")
+    def store_embedded_documents():
+        nonlocal pending_chunks, encoded_embeddings, encoded_chunks
+        if not pending_documents or pending_documents[0][1] > encoded_chunks:
+            return
+        if not encoded_embeddings: # Nothing embedded yet, so only documents without chunks are ready
+            while pending_documents and pending_documents[0][1] == 0:
+                corpus_store.add_document(pending_documents.popleft()[0], [])
+            return
+        embeddings = np.concatenate(encoded_embeddings)
+        offset = 0
+        while pending_documents and offset + pending_documents[0][1] <= encoded_chunks:
+            pdf_filename, chunk_count = pending_documents.popleft()
+            corpus_store.add_document(pdf_filename, pending_chunks[offset:offset + chunk_count], embeddings[offset:offset + chunk_count])
+            offset += chunk_count
+        pending_chunks = pending_chunks[offset:]
+        encoded_embeddings = [embeddings[offset:]]
+        encoded_chunks -= offset
 
-        # Extract text
-        text_content = extract_text_from_pdf(full_pdf_path)
-        if text_content is None:
-            continue # Skip to next PDF if extraction failed
+    def embed_pending(final):
+        nonlocal encoded_chunks, new_chunks
+        while len(pending_chunks) - encoded_chunks >= EMBED_BATCH_SIZE or (final and len(pending_chunks) > encoded_chunks):
+            batch = pending_chunks[encoded_chunks:encoded_chunks + EMBED_BATCH_SIZE]
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Embedding batch of {len(batch)} chunks...")
+            batch_embeddings, newly_encoded = _encode_length_sorted([chunk['text_chunk'] for chunk in batch])
+            encoded_embeddings.append(batch_embeddings)
+            new_chunks += newly_encoded
+            encoded_chunks += len(batch)
+        store_embedded_documents()
 
-        # Chunk text (pass filename to chunker to include in chunk metadata)
-        document_chunks = clean_and_chunk_text(text_content, pdf_filename)
-        if not document_chunks:
-            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] No processable chunks found in {pdf_filename}. Skipping.")
-            continue
-
-        # Embed chunks
-        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Embedding {len(document_chunks)} chunks from {pdf_filename}...")
-        chunk_texts = [chunk['text_chunk'] for chunk in document_chunks]
-        chunk_embeddings = model.encode(chunk_texts, show_progress_bar=False)
-
-        # --- Step 3: Calculate Similarities for chunks from this PDF ---
-        # Note: We iterate through chunks, calculate similarity, and append to the *global* lists.
-        for i, doc_item in enumerate(document_chunks):
-            current_chunk_embedding = chunk_embeddings[i].reshape(1, -1)
-            similarity = cosine_similarity(persona_embedding_reshaped, current_chunk_embedding)[0][0]
-
-            if similarity >= THRESHOLD:
-                # Add to main extracted sections list
-                all_extracted_sections.append({
-                    "document": doc_item["filename"],
-                    # Note: page_number as a list requires more sophisticated chunking
-                    # For now, if a chunk is mainly from one page, keep it as single or make a list like [doc_item["page_num"]]
-                    "page_number": [doc_item["page_num"]], # Example: force to list for consistency with your desired output
-                    "section_title": f"Relevant Section from {doc_item['filename']} on Page {doc_item['page_num']}",
-                    "importance_rank": float(similarity) # Ensure it's a float
-                })
-
-                # Add to main sub-section analysis list
-                all_sub_section_analysis.append({
-                    "document": doc_item["filename"],
-                    "page_number": doc_item["page_num"],
-                    "refined_text": doc_item["text_chunk"]
-                })
-        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Finished processing {pdf_filename}.")
-
-    # --- Step 4: Finalize and Sort Extracted Sections (after all PDFs are processed) ---
-    all_extracted_sections.sort(key=lambda x: x["importance_rank"], reverse=True)
+    if changed:
+        parsed_queue = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+        producer = threading.Thread(target=_produce_parsed_documents, daemon=True,
+                                    args=(changed, parsed_queue, PARSE_WORKERS, PIPELINE_QUEUE_DEPTH))
+        producer.start()
 
-    # --- Step 5: Prepare and Save JSON Output ---
-    output_data = {
+        # --- Consume parsed documents in order, embedding full batches as they fill up ---
+        while True:
+            item = parsed_queue.get()
+            if item is _END_OF_DOCUMENTS:
+                break
+            pdf_filename, document_chunks = item
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Processing PDF: {pdf_filename}")
+            if document_chunks is None:
+                corpus_store.add_document(pdf_filename, None, None) # Not retried until the file changes
+                continue # Skip to next PDF if extraction failed
+            if document_chunks is _PARSE_CRASHED:
+                corpus_store.remove_document(pdf_filename) # Left out of the manifest, so it is retried next run
+                continue
+            if not document_chunks:
+                print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] No processable chunks found in {pdf_filename}; recorded without chunks.")
+            if not embed:
+                corpus_store.add_document(pdf_filename, document_chunks) # Chunk records only
+            else:
+                pending_chunks.extend(document_chunks)
+                pending_documents.append((pdf_filename, len(document_chunks)))
+                processed_chunks += len(document_chunks)
+                embed_pending(final=False)
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Finished processing {pdf_filename}.")
+        producer.join()
+        if embed:
+            embed_pending(final=True)
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Encoded {new_chunks} new chunks, reused {processed_chunks - new_chunks} cached embeddings.")
+
+    dropped = corpus_store.commit()
+    if dropped:
+        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Compacted corpus index: dropped {dropped} chunks of removed or changed PDFs.")
+
+    # Persist embedding cache usage and keep the cache bounded
+    embedding_store = get_embedding_store()
+    embedding_store.flush()
+    if len(embedding_store) > EMBEDDING_CACHE_MAX_ROWS:
+        dropped = embedding_store.compact(max_rows=EMBEDDING_CACHE_MAX_ROWS)
+        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Compacted embedding cache: dropped {dropped} least recently used vectors.")
+
+    corpus_chunks, corpus_matrix = corpus_store.corpus()
+    return input_documents_for_output, corpus_chunks, corpus_matrix
+
+def build_output(persona_info, input_documents, extracted_sections, sub_section_analysis):
+    """Assembles the metadata / extracted_sections / subsection_analysis output for one persona."""
+    return {
         "metadata": {
-            "input_documents": input_documents_for_output, # List of all PDFs found and processed
+            "input_documents": input_documents, # List of all PDFs found and processed
             "persona": {
-                "role": persona_role,
-                "expertise": persona_expertise
+                "role": persona_info["role"],
+                "expertise": persona_info["expertise"]
             },
-            "job_to_be_done": job_to_be_done,
+            "job_to_be_done": persona_info["job_to_be_done"],
             "processing_timestamp": datetime.datetime.now().isoformat(timespec='seconds') + 'Z' # ISO 8601 with Z for UTC
         },
-        "extracted_sections": all_extracted_sections,
-        "subsection_analysis": all_sub_section_analysis
+        "extracted_sections": extracted_sections,
+        "subsection_analysis": sub_section_analysis
     }
 
-    # Save to JSON file
-    timestamp_str = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    output_filename = os.path.join(OUTPUT_DIR, f"document_intelligence_output_{timestamp_str}.json")
-
+def save_output(output_data, output_filename):
     try:
+        os.makedirs(os.path.dirname(output_filename) or ".", exist_ok=True)
         with open(output_filename, 'w', encoding='utf-8') as f:
             json.dump(output_data, f, indent=2, ensure_ascii=False)
         print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Document intelligence process completed. Output saved to {output_filename}")
     except Exception as e:
         print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error saving output to JSON: {e}")
+# --- Main Document Intelligence Function ---
+
+def run_document_intelligence_local(selected_persona_name):
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Starting Document Intelligence Process...")
+
+    persona_info = personas_data.get(selected_persona_name)
+    if not persona_info:
+        print(f"Error: Persona '{selected_persona_name}' not found.")
+        return {"error": f"Persona '{selected_persona_name}' not found."}
 
+    # --- Step 1: Load Persona Embedding ---
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Encoding persona job-to-be-done...")
+    persona_embedding = encode_queries([persona_info["job_to_be_done"]])
+
+    # --- Step 2: Discover and Process PDF Files ---
+    corpus = load_corpus(embed=not LEXICAL_PREFILTER)
+    if corpus is None:
+        return {"error": "No PDF files found."}
+    input_documents, corpus_chunks, corpus_matrix = corpus
+
+    # --- Step 3: Calculate Similarities for the whole corpus at once (or search the vector index / prefilter) ---
+    # --- Step 4: Select and Rank Extracted Sections (extracted_sections come out sorted by score) ---
+    if LEXICAL_PREFILTER:
+        lexical_index = build_lexical_index(corpus_chunks)
+        [(all_extracted_sections, all_sub_section_analysis)], embedded_count = rank_prefiltered(
+            persona_embedding, [persona_query_text(persona_info)], corpus_chunks, lexical_index)
+        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Embedded and scored {embedded_count} of {len(corpus_chunks)} chunks selected by the lexical prefilter.")
+    else:
+        corpus_index = load_corpus_index(corpus_chunks) if TOP_K is not None else None # The index only serves top-k mode
+        if corpus_index is not None:
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Searching vector index over {len(corpus_index)} chunks...")
+        else:
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Scoring {len(corpus_chunks)} chunks...")
+        [(all_extracted_sections, all_sub_section_analysis)] = rank_corpus(persona_embedding, corpus_chunks, corpus_matrix, corpus_index)
+
+    # --- Step 5: Prepare and Save JSON Output ---
+    output_data = build_output(persona_info, input_documents, all_extracted_sections, all_sub_section_analysis)
+    timestamp_str = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    save_output(output_data, os.path.join(OUTPUT_DIR, f"document_intelligence_output_{timestamp_str}.json"))
     return output_data
-# --- Main execution block (when the script is run directly) ---
-if __name__ == "__main__":
-    # Example usage:
-    # You can change the selected_persona_name here
-    run_document_intelligence_local(selected_persona_name="PhD Researcher in Computational Biology")
-    # run_document_intelligence_local(selected_persona_name="Data Scientist")
+# --- Multi-Persona Batch Function ---
+
+def _persona_slug(persona_name):
+    return re.sub(r'[^A-Za-z0-9]+', '_', persona_name).strip('_').lower()
+
+def run_document_intelligence_batch(persona_names=None):
+    """
+    Runs many personas against the same corpus: the PDFs are parsed, chunked and
+    embedded once, all persona queries are encoded in a single batch, and the corpus
+    is scored for all of them with one matrix-matrix product. Writes one output file
+    per persona (same schema as run_document_intelligence_local) and returns
+    {persona_name: output_data}. persona_names defaults to every persona in personas_data.
+    """
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Starting Document Intelligence Batch...")
+    persona_names = list(personas_data) if persona_names is None else list(persona_names)
+    unknown = [name for name in persona_names if name not in personas_data]
+    if unknown:
+        print(f"Error: Persona(s) not found: {unknown}")
+        return {"error": f"Persona(s) not found: {unknown}"}
+    if not persona_names:
+        return {}
+
+    corpus = load_corpus(embed=not LEXICAL_PREFILTER)
+    if corpus is None:
+        return {"error": "No PDF files found."}
+    input_documents, corpus_chunks, corpus_matrix = corpus
+
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Encoding {len(persona_names)} persona jobs-to-be-done...")
+    persona_embeddings = encode_queries([personas_data[name]["job_to_be_done"] for name in persona_names])
+
+    if LEXICAL_PREFILTER:
+        lexical_index = build_lexical_index(corpus_chunks)
+        ranked, embedded_count = rank_prefiltered(persona_embeddings, [persona_query_text(personas_data[name]) for name in persona_names],
+                                                  corpus_chunks, lexical_index)
+        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Embedded and scored {embedded_count} of {len(corpus_chunks)} chunks selected by the lexical prefilter.")
+    else:
+        corpus_index = load_corpus_index(corpus_chunks) if TOP_K is not None else None # The index only serves top-k mode
+        if corpus_index is not None:
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Searching vector index over {len(corpus_index)} chunks for {len(persona_names)} personas...")
+        else:
+            print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Scoring {len(corpus_chunks)} chunks for {len(persona_names)} personas...")
+        ranked = rank_corpus(persona_embeddings, corpus_chunks, corpus_matrix, corpus_index)
+
+    timestamp_str = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    outputs = {}
+    for persona_name, (extracted_sections, sub_section_analysis) in zip(persona_names, ranked):
+        output_data = build_output(personas_data[persona_name], input_documents, extracted_sections, sub_section_analysis)
+        save_output(output_data, os.path.join(OUTPUT_DIR, f"document_intelligence_output_{timestamp_str}_{_persona_slug(persona_name)}.json"))
+        outputs[persona_name] = output_data
+    return outputs
+# --- Offline Vector Index Build ---
+
+def build_vector_index():
+    """
+    Builds the approximate nearest-neighbour index over the current corpus, saves it to
+    VECTOR_INDEX_DIR and reports its recall@k against exact brute-force scoring.
+    The queries are the persona jobs-to-be-done plus a sample of corpus chunks; a sampled
+    chunk is excluded from its own results, so that it does not count as finding itself.
+    Returns the report, also written to VECTOR_INDEX_DIR/recall_report.json.
+    """
+    corpus = load_corpus()
+    if corpus is None:
+        return {"error": "No PDF files found."}
+    _, corpus_chunks, corpus_matrix = corpus
+    if not corpus_chunks:
+        return {"error": "No chunks to index."}
+
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Building vector index over {len(corpus_chunks)} chunks...")
+    IVFIndex.build(corpus_matrix, quantize=VECTOR_INDEX_QUANTIZE, fingerprint=corpus_chunks.fingerprint).save(VECTOR_INDEX_DIR)
+    corpus_index = IVFIndex.load(VECTOR_INDEX_DIR) # Report on the memory-mapped index, as it is used at query time
+
+    persona_embeddings = encode_queries([persona["job_to_be_done"] for persona in personas_data.values()])
+    sample = np.random.default_rng(0).choice(len(corpus_chunks), min(VECTOR_INDEX_RECALL_QUERIES, len(corpus_chunks)), replace=False)
+    sample = np.sort(sample)
+    queries = np.vstack([persona_embeddings, corpus_matrix[sample]])
+    own_rows = np.concatenate([np.full(len(persona_embeddings), -1), sample])
+    report = recall_report(corpus_index, corpus_matrix, queries, TOP_K or 10, VECTOR_INDEX_NPROBE, exclude=own_rows)
+    with open(os.path.join(VECTOR_INDEX_DIR, "recall_report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Vector index saved to {VECTOR_INDEX_DIR}: {json.dumps(report)}")
+    return report
+# --- Lexical Prefilter Report ---
+
+def prefilter_report():
+    """
+    Compares the lexical prefilter with full dense scoring on the current corpus, per persona:
+    recall of the dense winners (THRESHOLD / TOP_K), recall@k of the dense top k, and the
+    encoder work saved (distinct chunks the prefilter embeds vs. every chunk in the corpus).
+    Returns the report, also written to OUTPUT_DIR/prefilter_report.json.
+    """
+    corpus = load_corpus() # Dense scoring needs every chunk embedded
+    if corpus is None:
+        return {"error": "No PDF files found."}
+    _, corpus_chunks, corpus_matrix = corpus
+    if not corpus_chunks:
+        return {"error": "No chunks to score."}
 
+    k = TOP_K or 10
+    persona_names = list(personas_data)
+    query_embeddings = encode_queries([personas_data[name]["job_to_be_done"] for name in persona_names])
+    dense_scores = score_matrix(query_embeddings, corpus_matrix)
 
+    start = time.perf_counter()
+    lexical_index = build_lexical_index(corpus_chunks)
+    index_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    candidates, candidate_scores, embedded_count = _prefilter_scores(
+        query_embeddings, [persona_query_text(personas_data[name]) for name in persona_names], corpus_chunks, lexical_index)
+    query_seconds = time.perf_counter() - start
+
+    def recall(found, expected):
+        return len(np.intersect1d(found, expected)) / len(expected) if len(expected) else None
+
+    personas = []
+    for q, persona_name in enumerate(persona_names):
+        ids, scores = candidates[q], candidate_scores[q]
+        dense_winners = select_chunks(dense_scores[:, q], THRESHOLD, TOP_K)
+        personas.append({
+            "persona": persona_name,
+            "candidates": len(ids),
+            "dense_winners": len(dense_winners),
+            "recall": recall(ids[select_chunks(scores, THRESHOLD, TOP_K)] if len(ids) else ids, dense_winners),
+            "recall_at_k": recall(ids[select_chunks(scores, None, k)] if len(ids) else ids, select_chunks(dense_scores[:, q], None, k)),
+        })
+    recalls = [p["recall"] for p in personas if p["recall"] is not None]
+    report = {
+        "chunks": len(corpus_chunks),
+        "prefilter_candidates": PREFILTER_CANDIDATES,
+        "k": k,
+        "mean_recall": float(np.mean(recalls)) if recalls else None,
+        "mean_recall_at_k": float(np.mean([p["recall_at_k"] for p in personas])),
+        "chunks_embedded_dense": len(corpus_chunks),
+        "chunks_embedded_prefilter": embedded_count,
+        "encoder_work_saved": 1.0 - embedded_count / len(corpus_chunks),
+        "lexical_index_seconds": index_seconds,
+        "prefilter_query_seconds": query_seconds,
+        "personas": personas,
+    }
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(os.path.join(OUTPUT_DIR, "prefilter_report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Prefilter report saved to {os.path.join(OUTPUT_DIR, 'prefilter_report.json')}: {json.dumps({key: value for key, value in report.items() if key != 'personas'})}")
+    return report
+# --- Query Daemon ---
+
+class WarmCorpus:
+    """
+    The corpus as the daemon serves it: chunks plus either the unit-length embedding matrix
+    and (if current) the vector index, or, with LEXICAL_PREFILTER, the BM25 index.
+    """
+
+    def __init__(self):
+        corpus = load_corpus(embed=not LEXICAL_PREFILTER)
+        self.input_documents, self.corpus_chunks, corpus_matrix = corpus if corpus is not None else ([], [], None)
+        self.corpus_matrix = self.corpus_index = self.lexical_index = None
+        if self.corpus_chunks and LEXICAL_PREFILTER:
+            self.lexical_index = build_lexical_index(self.corpus_chunks)
+        elif self.corpus_chunks:
+            self.corpus_matrix = normalize_rows(corpus_matrix) # Normalized once, not per query
+            self.corpus_index = load_corpus_index(self.corpus_chunks)
+
+class DocumentIntelligenceServer(HTTPServer):
+    """
+    Localhost HTTP server answering persona queries against a WarmCorpus:
 
+        GET  /health  -> {"status", "documents", "chunks", "vector_index"}
+        POST /query   {"persona": <name in personas_data> or {"role", "expertise", "job_to_be_done"},
+                       optional "top_k", "threshold", "save"} -> output JSON (same schema as a run)
+        POST /reload  re-reads PDF_DIR (cached chunk embeddings are reused) and swaps the corpus in
+
+    Requests run on a pool of `workers` threads; once `workers + max_pending`
+    requests are in progress, new ones are read by a single rejecter thread and
+    answered 503 without doing any work. The listen backlog is sized so that a burst
+    of connections waits to be accepted (and answered, if need be, 503) rather than
+    being reset by the kernel.
+    """
+
+    def __init__(self, address, workers=DAEMON_WORKERS, max_pending=DAEMON_MAX_PENDING):
+        self.corpus = WarmCorpus()
+        self._reload_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self._rejecter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reject")
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._admission = threading.local() # Whether the current thread's request got a slot
+        self.request_queue_size = max(socket.SOMAXCONN, workers + max_pending) # Listen backlog (socketserver's default is 5)
+        super().__init__(address, _QueryHandler)
+
+    # --- Bounded request dispatch ---
+    def process_request(self, request, client_address):
+        if self._slots.acquire(blocking=False):
+            self._pool.submit(self._handle_request, request, client_address, True)
+        else:
+            self._rejecter.submit(self._handle_request, request, client_address, False)
+
+    def _handle_request(self, request, client_address, admitted):
+        self._admission.admitted = admitted
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            if admitted:
+                self._slots.release()
+
+    def admitted(self):
+        return getattr(self._admission, "admitted", True)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+        self._rejecter.shutdown(wait=True)
+
+    # --- Endpoints ---
+    def health(self):
+        corpus = self.corpus
+        return 200, {"status": "ok", "documents": corpus.input_documents, "chunks": len(corpus.corpus_chunks),
+                     "vector_index": corpus.corpus_index is not None, "lexical_prefilter": corpus.lexical_index is not None}
+
+    def reload(self):
+        with self._reload_lock: # One reload at a time; queries keep using the old corpus until the swap
+            self.corpus = WarmCorpus()
+        return self.health()
+
+    def query(self, request):
+        persona = request.get("persona")
+        if isinstance(persona, str):
+            persona_info = personas_data.get(persona)
+            if persona_info is None:
+                return 404, {"error": f"Persona '{persona}' not found."}
+        elif isinstance(persona, dict) and isinstance(persona.get("job_to_be_done"), str):
+            persona_info = {"role": persona.get("role", ""), "expertise": persona.get("expertise", []), "job_to_be_done": persona["job_to_be_done"]}
+        else:
+            return 400, {"error": "'persona' must be a persona name or an object with a 'job_to_be_done'."}
+        top_k = request.get("top_k", TOP_K)
+        threshold = request.get("threshold", THRESHOLD)
+        if top_k is not None and (not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1):
+            return 400, {"error": "'top_k' must be a positive integer or null."}
+        if threshold is not None and (not isinstance(threshold, (int, float)) or isinstance(threshold, bool)):
+            return 400, {"error": "'threshold' must be a number or null."}
+
+        corpus = self.corpus # Keep one snapshot for the whole request, even if a reload swaps it meanwhile
+        query_embedding = encode_queries([persona_info["job_to_be_done"]])
+        if corpus.lexical_index is not None:
+            [(extracted_sections, sub_section_analysis)], _ = rank_prefiltered(
+                query_embedding, [persona_query_text(persona_info)], corpus.corpus_chunks, corpus.lexical_index,
+                threshold=threshold, top_k=top_k)
+        else:
+            [(extracted_sections, sub_section_analysis)] = rank_corpus(
+                query_embedding, corpus.corpus_chunks, corpus.corpus_matrix,
+                corpus.corpus_index, threshold=threshold, top_k=top_k, chunks_normalized=True)
+        output_data = build_output(persona_info, corpus.input_documents, extracted_sections, sub_section_analysis)
+        if request.get("save"):
+            timestamp_str = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+            save_output(output_data, os.path.join(OUTPUT_DIR, f"document_intelligence_output_{timestamp_str}_{_persona_slug(persona_info['role']) or 'persona'}.json"))
+        return 200, output_data
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    # HTTP/1.0: one request per connection, so an idle client never holds a worker
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self.server.admitted():
+            self._send_json(503, {"error": "Server busy, retry later."})
+        elif self.path == "/health":
+            self._send_json(*self.server.health())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "Request body must be JSON."})
+            return
+        if not self.server.admitted():
+            self._send_json(503, {"error": "Server busy, retry later."})
+        elif not isinstance(request, dict):
+            self._send_json(400, {"error": "Request body must be a JSON object."})
+        elif self.path == "/query":
+            self._send_json(*self.server.query(request))
+        elif self.path == "/reload":
+            self._send_json(*self.server.reload())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def log_message(self, format, *args):
+        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {self.address_string()} {format % args}")
+
+def run_daemon(host=DAEMON_HOST, port=DAEMON_PORT, workers=DAEMON_WORKERS):
+    """Loads the model and the corpus once, then serves queries until interrupted."""
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Starting Document Intelligence daemon...")
+    get_model()
+    server = DocumentIntelligenceServer((host, port), workers=workers)
+    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Serving {len(server.corpus.corpus_chunks)} chunks on http://{host}:{server.server_port} with {workers} workers.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+# --- Main execution block (when the script is run directly) ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persona-based document intelligence over the PDFs in PDF_DIR.")
+    parser.add_argument("--persona", action="append", help="Persona name from personas_data (repeat for several personas).")
+    parser.add_argument("--all-personas", action="store_true", help="Run every persona in personas_data in one batch.")
+    parser.add_argument("--build-index", action="store_true", help="Build the vector index over the corpus and report its recall, then exit.")
+    parser.add_argument("--prefilter-report", action="store_true", help="Report the lexical prefilter's recall and saved encoder work, then exit.")
+    parser.add_argument("--serve", action="store_true", help="Run as a daemon answering persona queries over localhost HTTP.")
+    parser.add_argument("--host", default=DAEMON_HOST, help="Daemon bind address (default: %(default)s).")
+    parser.add_argument("--port", type=int, default=DAEMON_PORT, help="Daemon port (default: %(default)s).")
+    parser.add_argument("--workers", type=int, default=DAEMON_WORKERS, help="Daemon requests handled concurrently (default: %(default)s).")
+    args = parser.parse_args()
 
+    if args.serve:
+        run_daemon(args.host, args.port, max(1, args.workers))
+    elif args.build_index:
+        build_vector_index()
+    elif args.prefilter_report:
+        prefilter_report()
+    elif args.all_personas or (args.persona and len(args.persona) > 1):
+        # Several personas share one corpus pass
+        run_document_intelligence_batch(None if args.all_personas else args.persona)
+    else:
+        # Example usage:
+        # You can change the selected_persona_name here, or pass --persona "Data Scientist"
+        run_document_intelligence_local(selected_persona_name=args.persona[0] if args.persona else "PhD Researcher in Computational Biology")
+        # run_document_intelligence_local(selected_persona_name="Data Scientist")
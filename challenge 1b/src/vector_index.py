@@ -0,0 +1,224 @@
+# Approximate nearest-neighbour index (IVF) over chunk embeddings.
+# Built offline by main.py --build-index and memory-mapped at query time.
+import os
+import json
+import time
+import numpy as np
+
+INDEX_VERSION = 1
+POINTS_PER_LIST = 39 # Fewest training points per inverted list for k-means to be meaningful
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=-1, keepdims=True), 1e-12)
+
+
+def default_nlist(rows):
+    """Number of inverted lists for a corpus of `rows` vectors: about 4 * sqrt(rows)."""
+    return int(max(1, min(4 * np.sqrt(rows), rows // POINTS_PER_LIST)))
+
+
+def _assign(vectors, centroids, block_rows=65536):
+    """Nearest centroid (by cosine) of each row, computed in blocks to bound memory."""
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_rows):
+        assignment[start:start + block_rows] = np.argmax(vectors[start:start + block_rows] @ centroids.T, axis=1)
+    return assignment
+
+
+def _train_centroids(vectors, nlist, iterations, seed):
+    """Spherical k-means on a sample of the (normalized) vectors."""
+    rng = np.random.default_rng(seed)
+    sample_rows = min(len(vectors), nlist * 64)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_rows, replace=False))]
+    centroids = sample[rng.choice(sample_rows, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign(sample, centroids)
+        counts = np.bincount(assignment, minlength=nlist)
+        order = np.argsort(assignment, kind="stable")
+        sums = np.zeros_like(centroids)
+        filled = np.flatnonzero(counts)
+        sums[filled] = np.add.reduceat(sample[order], (np.cumsum(counts) - counts)[filled])
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = sample[rng.choice(sample_rows, len(empty), replace=False)] # Reseed empty lists
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index for cosine top-k search. The vectors are clustered into
+    `nlist` lists by spherical k-means; a query scans only the `nprobe` lists whose
+    centroids are most similar to it. Laid out as flat files in <index_dir>/:
+
+        centroids.f32  float32 (nlist, dim) list centroids
+        offsets.i64    int64 (nlist + 1) start of each list in the rows below
+        ids.i64        int64 corpus row of each stored vector, grouped by list
+        vectors.f32    float32 (rows, dim) normalized vectors, grouped by list, or
+        codes.i8       int8 (rows, dim) codes + scales.f32 per-row scale when quantized
+        meta.json      {"version", "dim", "rows", "nlist", "quantize", "fingerprint"};
+                       written last, so a half-written index is never loaded
+
+    With quantize=True each normalized vector is stored as int8 codes times one
+    float32 scale per row (4x smaller); scores are then approximate as well.
+    """
+
+    def __init__(self, centroids, offsets, ids, vectors=None, codes=None, scales=None, fingerprint=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.codes = codes
+        self.scales = scales
+        self.fingerprint = fingerprint # Identifies the corpus the index was built from (set by the caller)
+
+    @property
+    def quantize(self):
+        return self.codes is not None
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Build ---
+    @classmethod
+    def build(cls, vectors, nlist=None, quantize=False, iterations=10, seed=0, fingerprint=None):
+        """Builds an index over the rows of vectors; row i is returned as id i by search()."""
+        vectors = _normalize(vectors)
+        nlist = default_nlist(len(vectors)) if nlist is None else max(1, min(nlist, len(vectors)))
+        centroids = _train_centroids(vectors, nlist, iterations, seed)
+        assignment = _assign(vectors, centroids)
+        ids = np.argsort(assignment, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=offsets[1:])
+        grouped = vectors[ids]
+        if not quantize:
+            return cls(centroids, offsets, ids, vectors=grouped, fingerprint=fingerprint)
+        scales = np.maximum(np.abs(grouped).max(axis=1), 1e-12) / 127.0
+        codes = np.round(grouped / scales[:, None]).astype(np.int8)
+        return cls(centroids, offsets, ids, codes=codes, scales=scales.astype(np.float32), fingerprint=fingerprint)
+
+    # --- Persistence ---
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        meta_path = os.path.join(index_dir, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path) # Invalidate the old index before its files are overwritten
+        arrays = {"centroids.f32": self.centroids, "offsets.i64": self.offsets, "ids.i64": self.ids}
+        if self.quantize:
+            arrays.update({"codes.i8": self.codes, "scales.f32": self.scales})
+        else:
+            arrays["vectors.f32"] = self.vectors
+        for name, array in arrays.items():
+            np.ascontiguousarray(array).tofile(os.path.join(index_dir, name))
+        meta = {"version": INDEX_VERSION, "dim": int(self.centroids.shape[1]), "rows": len(self.ids),
+                "nlist": self.nlist, "quantize": self.quantize, "fingerprint": self.fingerprint}
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    @classmethod
+    def load(cls, index_dir):
+        """Memory-maps a saved index read-only. Returns None if there is no complete index."""
+        meta_path = os.path.join(index_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            return None
+        dim, rows, nlist = meta["dim"], meta["rows"], meta["nlist"]
+
+        def mapped(name, dtype, shape):
+            if not rows and name not in ("centroids.f32", "offsets.i64"):
+                return np.zeros(shape, dtype=dtype)
+            return np.memmap(os.path.join(index_dir, name), dtype=dtype, mode="r", shape=shape)
+
+        arrays = {
+            "centroids": np.array(mapped("centroids.f32", np.float32, (nlist, dim))), # Small; scanned on every query
+            "offsets": np.array(mapped("offsets.i64", np.int64, (nlist + 1,))),
+            "ids": mapped("ids.i64", np.int64, (rows,)),
+        }
+        if meta["quantize"]:
+            arrays["codes"] = mapped("codes.i8", np.int8, (rows, dim))
+            arrays["scales"] = mapped("scales.f32", np.float32, (rows,))
+        else:
+            arrays["vectors"] = mapped("vectors.f32", np.float32, (rows, dim))
+        return cls(fingerprint=meta.get("fingerprint"), **arrays)
+
+    # --- Query ---
+    def _score_range(self, start, end, query):
+        if self.quantize:
+            return (self.codes[start:end].astype(np.float32) @ query) * self.scales[start:end]
+        return self.vectors[start:end] @ query
+
+    def search(self, queries, k, nprobe=8):
+        """
+        Approximate cosine top-k for each query. Returns (ids, scores), both of shape
+        (num_queries, k) and sorted best first; missing results are padded with id -1
+        and score -inf.
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        nprobe = max(1, min(nprobe, self.nlist))
+        result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        centroid_scores = queries @ self.centroids.T
+        for q, query in enumerate(queries):
+            probe = np.argpartition(-centroid_scores[q], nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+            ranges = [(self.offsets[l], self.offsets[l + 1]) for l in np.sort(probe) if self.offsets[l + 1] > self.offsets[l]]
+            if not ranges:
+                continue
+            scores = np.concatenate([self._score_range(start, end, query) for start, end in ranges])
+            rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+            if len(scores) > k:
+                best = np.argpartition(-scores, k - 1)[:k]
+                scores, rows = scores[best], rows[best]
+            order = np.argsort(-scores, kind="stable")
+            result_ids[q, :len(order)] = self.ids[rows[order]]
+            result_scores[q, :len(order)] = scores[order]
+        return result_ids, result_scores
+
+
+def recall_report(index, vectors, queries, k, nprobe=8, exclude=None):
+    """
+    Compares index.search against exact brute-force cosine top-k over vectors.
+    Returns recall@k (fraction of the exact top-k found) and per-query latency.
+    exclude gives, per query, the row of vectors it was taken from (-1 for none). That row
+    is left out of both the exact and the index top-k, so that a query does not count as
+    finding itself.
+    """
+    queries = _normalize(np.atleast_2d(queries))
+    exclude = np.full(len(queries), -1, dtype=np.int64) if exclude is None else np.asarray(exclude, dtype=np.int64)
+    k = max(1, min(k, len(vectors)))
+    exact_scores = _normalize(vectors) @ queries.T
+    found, expected, latencies = 0, 0, []
+    for q, query in enumerate(queries):
+        own = exclude[q]
+        start = time.perf_counter()
+        ids, _ = index.search(query, k + 1 if own >= 0 else k, nprobe) # One deeper, as the query's own row is dropped
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        ids = ids[0][(ids[0] >= 0) & (ids[0] != own)][:k]
+        scores = exact_scores[:, q].copy()
+        if own >= 0:
+            scores[own] = -np.inf
+        exact = np.argpartition(-scores, k - 1)[:k]
+        exact = exact[np.isfinite(scores[exact])] # Fewer than k when the corpus is just the query's own row
+        found += len(np.intersect1d(exact, ids))
+        expected += len(exact)
+    return {
+        "rows": len(index),
+        "nlist": index.nlist,
+        "nprobe": min(nprobe, index.nlist),
+        "quantize": index.quantize,
+        "k": k,
+        "queries": len(queries),
+        "queries_from_vectors": int(np.sum(exclude >= 0)),
+        "recall": found / expected if expected else None,
+        "mean_query_ms": float(np.mean(latencies)) if latencies else None,
+        "p95_query_ms": float(np.percentile(latencies, 95)) if latencies else None,
+    }
@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import main  # noqa: E402
+
+
+def test_flooded_daemon_answers_503_instead_of_resetting(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "PDF_DIR", str(tmp_path / "pdfs"))
+    monkeypatch.setattr(main, "_corpus_stores", {})
+    monkeypatch.setattr(main, "CORPUS_INDEX_DIR", str(tmp_path / "corpus_index"))
+    server = main.DocumentIntelligenceServer(("127.0.0.1", 0), workers=2, max_pending=2)
+
+    release = threading.Event()
+    health = server.health
+
+    def held_health():
+        release.wait(30) # Admitted requests hold their slot until every other client has its answer
+        return health()
+
+    monkeypatch.setattr(server, "health", held_health)
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+
+    clients = 200
+    start = threading.Barrier(clients)
+
+    def get_health(_):
+        start.wait()
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=30)
+        try:
+            connection.request("GET", "/health")
+            response = connection.getresponse()
+            status = response.status
+            json.loads(response.read())
+            return status
+        finally:
+            connection.close()
+
+    try:
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            futures = [pool.submit(get_health, i) for i in range(clients)]
+            for _ in range(400): # All but the four admitted requests are answered right away
+                if sum(future.done() for future in futures) >= clients - 4:
+                    break
+                release.wait(0.05)
+            release.set()
+            statuses = [future.result() for future in futures] # Raises on a connection reset
+    finally:
+        release.set()
+        server.shutdown()
+        server.server_close()
+
+    assert statuses.count(200) == 4
+    assert statuses.count(503) == clients - 4
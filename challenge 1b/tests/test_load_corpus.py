@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import main  # noqa: E402
+
+
+class FakeModel:
+    """Stands in for the SentenceTransformer: deterministic 8-dimensional vectors."""
+
+    def encode(self, texts, **kwargs):
+        return np.array([[len(text), sum(map(ord, text)) % 97, 1, 0, 0, 0, 0, 0] for text in texts], dtype=np.float32)
+
+
+def write_pdf(path, pages):
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        if text:
+            page.insert_text((72, 72), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def use_dirs(monkeypatch, root):
+    """Points the pipeline at fresh pdfs/, corpus and cache directories under root."""
+    pdf_dir = root / "pdfs"
+    pdf_dir.mkdir(parents=True)
+    monkeypatch.setattr(main, "PDF_DIR", str(pdf_dir))
+    monkeypatch.setattr(main, "CORPUS_INDEX_DIR", str(root / "corpus_index"))
+    monkeypatch.setattr(main, "EMBEDDING_CACHE_DIR", str(root / "embedding_cache"))
+    monkeypatch.setattr(main, "_corpus_stores", {})
+    monkeypatch.setattr(main, "_embedding_store", None)
+    return pdf_dir
+
+
+@pytest.fixture
+def corpus_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "PARSE_WORKERS", 1)
+    monkeypatch.setattr(main, "_model", FakeModel())
+    return use_dirs(monkeypatch, tmp_path)
+
+
+def manifest(tmp_path):
+    with open(tmp_path / "corpus_index" / "manifest.json", encoding="utf-8") as f:
+        return json.load(f)["documents"]
+
+
+def test_text_less_pdf_alone_is_recorded_without_chunks(corpus_dirs, tmp_path):
+    write_pdf(str(corpus_dirs / "blank.pdf"), ["", ""])
+
+    input_documents, corpus_chunks, corpus_matrix = main.load_corpus()
+
+    assert input_documents == ["blank.pdf"]
+    assert len(corpus_chunks) == 0
+    entry = manifest(tmp_path)["blank.pdf"]
+    assert entry["end"] - entry["start"] == 0 and not entry["failed"]
+
+
+def test_text_less_pdf_next_to_a_normal_one(corpus_dirs, tmp_path):
+    write_pdf(str(corpus_dirs / "blank.pdf"), ["", ""])
+    write_pdf(str(corpus_dirs / "paper.pdf"), [
+        "Graph neural networks predict molecular properties from atom and bond features.",
+        "Message passing aggregates neighbour states over several rounds.",
+        "Benchmarks compare the models on solubility and toxicity datasets.",
+    ])
+
+    _, corpus_chunks, corpus_matrix = main.load_corpus()
+
+    assert len(corpus_chunks) > 0
+    assert {chunk["filename"] for chunk in corpus_chunks} == {"paper.pdf"}
+    assert corpus_matrix.shape == (len(corpus_chunks), 8)
+    assert set(manifest(tmp_path)) == {"blank.pdf", "paper.pdf"}
+
+    # A second run finds nothing to do and returns the same corpus
+    main._corpus_stores.clear() # Reopen the corpus from disk
+    _, again, _ = main.load_corpus()
+    assert list(again) == list(corpus_chunks)
+
+
+def vectors_by_chunk(corpus_chunks, corpus_matrix):
+    return {(chunk["filename"], chunk["text_chunk"]): corpus_matrix[i].tolist() for i, chunk in enumerate(corpus_chunks)}
+
+
+def test_incremental_build_matches_fresh_build_with_near_duplicates(corpus_dirs, tmp_path, monkeypatch):
+    words = "graph neural networks predict molecular properties from atom and bond features".split()
+    pages = [" ".join(words[i:] + words[:i]) for i in range(3)]
+    near_duplicate = pages[:2] + [pages[2] + " today"] # Same text but for one word
+
+    write_pdf(str(corpus_dirs / "a.pdf"), pages)
+    main.load_corpus()
+    write_pdf(str(corpus_dirs / "b.pdf"), near_duplicate)
+    _, chunks, matrix = main.load_corpus()
+    incremental = vectors_by_chunk(chunks, matrix)
+
+    fresh_dir = use_dirs(monkeypatch, tmp_path / "fresh")
+    write_pdf(str(fresh_dir / "a.pdf"), pages)
+    write_pdf(str(fresh_dir / "b.pdf"), near_duplicate)
+    _, chunks, matrix = main.load_corpus()
+
+    assert vectors_by_chunk(chunks, matrix) == incremental
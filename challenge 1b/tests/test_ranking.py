@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import main  # noqa: E402
+
+WORDS = "model data analysis graph neural network molecular property prediction drug discovery dataset".split()
+
+
+def text(seed, length=60):
+    rng = np.random.default_rng(seed)
+    return " ".join(rng.choice(WORDS, length))
+
+
+def chunk(filename, text_chunk):
+    return {"filename": filename, "page_num": 1, "page_end": 1, "text_chunk": text_chunk}
+
+
+def test_rank_corpus_drops_near_duplicate_winners_and_fills_top_k():
+    base = text(0)
+    chunks = [
+        chunk("a.pdf", base),
+        chunk("b.pdf", base + " again"),        # Near duplicate of the best chunk
+        chunk("c.pdf", base.upper()),           # Exact duplicate, compared case-insensitively
+        chunk("d.pdf", text(1)),
+        chunk("e.pdf", text(2)),
+    ]
+    query = np.array([[1.0, 0.0]])
+    matrix = np.array([[1.0, 0.0], [0.99, 0.1], [0.98, 0.2], [0.5, 0.5], [0.1, 1.0]])
+
+    [(sections, _)] = main.rank_corpus(query, chunks, matrix, threshold=None, top_k=2)
+
+    assert [section["document"] for section in sections] == ["a.pdf", "d.pdf"]
+
+
+def test_rank_corpus_keeps_own_scores_of_distinct_chunks():
+    chunks = [chunk("a.pdf", text(0)), chunk("b.pdf", text(1))]
+    query = np.array([[1.0, 0.0]])
+    matrix = np.array([[0.6, 0.8], [1.0, 0.0]])
+
+    [(sections, _)] = main.rank_corpus(query, chunks, matrix, threshold=None, top_k=None)
+
+    assert [section["document"] for section in sections] == ["b.pdf", "a.pdf"]
+    assert [round(section["importance_rank"], 6) for section in sections] == [1.0, 0.6]
+
+
+def test_rank_corpus_reads_threshold_and_top_k_at_call_time(monkeypatch):
+    chunks = [chunk("a.pdf", text(0)), chunk("b.pdf", text(1)), chunk("c.pdf", text(2))]
+    query = np.array([[1.0, 0.0]])
+    matrix = np.array([[1.0, 0.0], [0.8, 0.6], [0.0, 1.0]])
+    monkeypatch.setattr(main, "THRESHOLD", 0.7)
+    monkeypatch.setattr(main, "TOP_K", 1)
+
+    [(sections, _)] = main.rank_corpus(query, chunks, matrix)
+    assert [section["document"] for section in sections] == ["a.pdf"]
+
+    [(sections, _)] = main.rank_corpus(query, chunks, matrix, top_k=None)
+    assert [section["document"] for section in sections] == ["a.pdf", "b.pdf"]
@@ -0,0 +1,35 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from vector_index import IVFIndex, recall_report  # noqa: E402
+
+
+def clustered_vectors(rows=400, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    return (centers[rng.integers(0, len(centers), rows)] + 0.5 * rng.normal(size=(rows, dim))).astype(np.float32)
+
+
+def test_recall_of_exhaustive_search_is_exact_without_self_matches():
+    vectors = clustered_vectors()
+    index = IVFIndex.build(vectors, nlist=8)
+    sample = np.arange(0, len(vectors), 10)
+
+    report = recall_report(index, vectors, vectors[sample], k=10, nprobe=8, exclude=sample)
+
+    assert report["recall"] == 1.0
+    assert report["queries_from_vectors"] == len(sample)
+
+
+def test_self_matches_no_longer_inflate_recall():
+    vectors = clustered_vectors()
+    index = IVFIndex.build(vectors, nlist=32)
+    sample = np.arange(0, len(vectors), 10)
+
+    with_self = recall_report(index, vectors, vectors[sample], k=5, nprobe=1)
+    without_self = recall_report(index, vectors, vectors[sample], k=5, nprobe=1, exclude=sample)
+
+    # Every query finds itself, so counting that adds one sure hit out of k per query
+    assert without_self["recall"] < with_self["recall"]